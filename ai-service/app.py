@@ -5,13 +5,18 @@ Main entry point for the AI Payment Parser Service.
 Provides REST API endpoints for parsing payment screenshots.
 """
 
+import asyncio
 import logging
 import os
-from datetime import datetime
+import threading
 from contextlib import asynccontextmanager
+from functools import lru_cache
 
-from fastapi import FastAPI, HTTPException
+import orjson
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 # Load environment variables from .env file
 try:
@@ -29,10 +34,18 @@ from models.schemas import (
     HealthResponse,
     StatusResponse,
 )
-from services.payment_parser import PaymentParserService
+from providers.http import open_http_session, close_http_session
+from utils.time_utils import iso_now
 from config import (
     AI_SERVICE_ENABLED,
     LOG_LEVEL,
+    WEB_CONCURRENCY,
+    LIMIT_CONCURRENCY,
+    LIMIT_MAX_REQUESTS,
+    TIMEOUT_KEEP_ALIVE,
+    PARSE_BATCH_ENABLED,
+    PARSE_BATCH_MAX_SIZE,
+    PARSE_BATCH_MAX_WAIT_MS,
     get_service_status,
 )
 
@@ -50,14 +63,35 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("AI Service starting up...")
     logger.info(f"Service enabled: {AI_SERVICE_ENABLED}")
-    status = get_service_status()
-    logger.info(f"Provider: {status['provider']}")
-    logger.info(f"Daily limit: {status['daily_limit']}")
+    try:
+        status = await get_service_status()
+        logger.info(f"Provider: {status['provider']}")
+        logger.info(f"Daily limit: {status['daily_limit']}")
+    except Exception as e:
+        # Counter store (Redis / counter file) unavailable - still start and serve /health
+        logger.error(f"Could not read service status at startup: {e}")
+    
+    # Shared connection pool for provider calls - must exist before the provider is built
+    await open_http_session()
+    
+    # Load the parser in the background so /health can pass immediately
+    global _warm_task
+    _warm_task = asyncio.create_task(asyncio.to_thread(_warm_parser))
+    
+    if PARSE_BATCH_ENABLED:
+        logger.info(
+            f"Request batching enabled (max {PARSE_BATCH_MAX_SIZE} per batch, "
+            f"{PARSE_BATCH_MAX_WAIT_MS}ms window)"
+        )
     
     yield
     
     # Shutdown
     logger.info("AI Service shutting down...")
+    _warm_task.cancel()
+    if _create_parser.cache_info().currsize:
+        await get_parser().close()
+    await close_http_session()
 
 
 # Create FastAPI app
@@ -66,6 +100,7 @@ app = FastAPI(
     description="Parse UPI payment screenshots using AI models",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Add CORS middleware
@@ -77,8 +112,76 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create service instance
-payment_parser = PaymentParserService()
+# Startup warm-up task (see lifespan) and the lock that keeps it and a
+# concurrent first request from each building their own parser
+_warm_task: "asyncio.Task | None" = None
+_parser_lock = threading.Lock()
+
+
+def get_parser():
+    """
+    Get the payment parser service, creating it on first use.
+    
+    The import is deferred because it pulls in the AI SDK and PIL, which
+    would otherwise slow down every worker's startup and readiness.
+    Request handlers should use get_ready_parser instead.
+    """
+    with _parser_lock:
+        return _create_parser()
+
+
+@lru_cache(maxsize=None)
+def _create_parser():
+    """Build the parser (cached - call via get_parser)."""
+    from services.payment_parser import PaymentParserService
+    return PaymentParserService()
+
+
+async def get_ready_parser():
+    """
+    Get the parser from the event loop.
+    
+    Waits for the startup warm-up first, so a request arriving mid warm-up
+    neither builds a second parser nor blocks the loop on the lock.
+    """
+    if _warm_task is not None and not _warm_task.done():
+        await asyncio.shield(_warm_task)
+    return get_parser()
+
+
+def _warm_parser():
+    """Import the parser and build its provider (runs in a worker thread)."""
+    try:
+        get_parser().provider
+        logger.info("Payment parser ready")
+    except Exception as e:
+        logger.warning(f"Payment parser warm-up failed: {e}")
+
+# Static response bodies - everything here is fixed for the life of the process,
+# so serialize once instead of per request
+_HEALTH_BODY_PREFIX = orjson.dumps({
+    "status": "healthy" if AI_SERVICE_ENABLED else "unhealthy",
+    "service": "ai-service",
+})[:-1] + b',"timestamp":"'
+
+_VERSION_BODY = orjson.dumps({
+    "service": "ai-service",
+    "version": os.environ.get("APP_VERSION", "1.0.0"),
+    "buildDate": os.environ.get("BUILD_DATE"),
+    "pythonVersion": f"{os.sys.version_info.major}.{os.sys.version_info.minor}.{os.sys.version_info.micro}",
+    "environment": os.environ.get("ENVIRONMENT", "development"),
+})
+
+_ROOT_BODY = orjson.dumps({
+    "service": "ai-payment-parser",
+    "version": "1.0.0",
+    "status": "running" if AI_SERVICE_ENABLED else "disabled",
+    "endpoints": {
+        "health": "/health",
+        "status": "/status",
+        "parse": "/parse-payment"
+    }
+})
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -88,10 +191,9 @@ async def health_check():
     
     Returns basic health status for k8s probes.
     """
-    return HealthResponse(
-        status="healthy" if AI_SERVICE_ENABLED else "unhealthy",
-        service="ai-service",
-        timestamp=datetime.utcnow().isoformat()
+    return Response(
+        content=_HEALTH_BODY_PREFIX + iso_now().encode() + b'"}',
+        media_type="application/json",
     )
 
 
@@ -102,13 +204,7 @@ async def version_info():
     
     Returns deployment version and build date for monitoring.
     """
-    return {
-        "service": "ai-service",
-        "version": os.environ.get("APP_VERSION", "1.0.0"),
-        "buildDate": os.environ.get("BUILD_DATE"),
-        "pythonVersion": f"{os.sys.version_info.major}.{os.sys.version_info.minor}.{os.sys.version_info.micro}",
-        "environment": os.environ.get("ENVIRONMENT", "development"),
-    }
+    return Response(content=_VERSION_BODY, media_type="application/json")
 
 
 @app.get("/status", response_model=StatusResponse)
@@ -118,8 +214,13 @@ async def service_status():
     
     Returns current configuration and usage statistics.
     """
-    status = get_service_status()
-    return StatusResponse(**status)
+    status = await get_service_status()
+    # Values come from trusted config - skip re-validation
+    return StatusResponse.model_construct(**status)
+
+
+# Model listings change on the order of days - cache per provider for 10 minutes
+_MODEL_LIST_CACHE: TTLCache = TTLCache(maxsize=4, ttl=600)
 
 
 @app.get("/models")
@@ -129,20 +230,14 @@ async def list_available_models():
     Useful for debugging model availability.
     """
     try:
-        from providers import get_provider
-        provider = get_provider()
+        provider = (await get_ready_parser()).provider
         
         if provider.get_provider_name() == "google_ai_studio":
-            import google.generativeai as genai
-            models = []
+            models = _MODEL_LIST_CACHE.get(provider.get_provider_name())
             try:
-                for model in genai.list_models():
-                    if 'generateContent' in model.supported_generation_methods:
-                        models.append({
-                            "name": model.name,
-                            "display_name": model.display_name,
-                            "description": model.description,
-                        })
+                if models is None:
+                    models = await provider.list_models()
+                    _MODEL_LIST_CACHE[provider.get_provider_name()] = models
             except Exception as e:
                 return {
                     "success": False,
@@ -187,7 +282,8 @@ async def parse_payment(request: ParsePaymentRequest):
     logger.info(f"Received parse-payment request (match_date: {request.match_date})")
     
     # Process the image
-    response = await payment_parser.parse_payment_screenshot(
+    parser = await get_ready_parser()
+    response = await parser.parse_payment_screenshot(
         image_base64=request.image_base64,
         match_date=request.match_date
     )
@@ -209,18 +305,21 @@ async def parse_payment(request: ParsePaymentRequest):
 @app.get("/")
 async def root():
     """Root endpoint - basic service info."""
-    return {
-        "service": "ai-payment-parser",
-        "version": "1.0.0",
-        "status": "running" if AI_SERVICE_ENABLED else "disabled",
-        "endpoints": {
-            "health": "/health",
-            "status": "/status",
-            "parse": "/parse-payment"
-        }
-    }
+    return Response(content=_ROOT_BODY, media_type="application/json")
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=WEB_CONCURRENCY,
+        limit_concurrency=LIMIT_CONCURRENCY,
+        # A lone worker has no supervisor to restart it - only recycle with several
+        limit_max_requests=LIMIT_MAX_REQUESTS if WEB_CONCURRENCY > 1 else None,
+        timeout_keep_alive=TIMEOUT_KEEP_ALIVE,
+        access_log=False,
+    )
@@ -5,7 +5,9 @@ Environment-based configuration with strong cost guardrails.
 """
 
 import os
-from typing import Set
+import time
+import fcntl
+import asyncio
 from datetime import datetime, date
 
 # =============================================================================
@@ -20,6 +22,10 @@ AI_PROVIDER = os.getenv("AI_PROVIDER", "google_ai_studio")
 
 # Google AI Studio
 GOOGLE_AI_STUDIO_API_KEY = os.getenv("GOOGLE_AI_STUDIO_API_KEY", "")
+# Per-process limits on Gemini calls - keep under the free-tier quota so
+# bursts wait here instead of failing with 429s
+GOOGLE_AI_STUDIO_MAX_CONCURRENCY = int(os.getenv("GOOGLE_AI_STUDIO_MAX_CONCURRENCY", "4"))
+GOOGLE_AI_STUDIO_RPM = int(os.getenv("GOOGLE_AI_STUDIO_RPM", "15"))
 
 # OpenRouter (future)
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
@@ -29,7 +35,7 @@ OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 # =============================================================================
 
 # WHITELIST of FREE models ONLY - any model not in this list will be BLOCKED
-ALLOWED_FREE_MODELS: Set[str] = {
+ALLOWED_FREE_MODELS: frozenset[str] = frozenset({
     # Google AI Studio free models (Gemini) - Updated for new API
     "gemini-1.5-flash",
     "gemini-1.5-flash-latest",
@@ -48,44 +54,157 @@ ALLOWED_FREE_MODELS: Set[str] = {
     # OpenRouter free models
     "meta-llama/llama-3.2-11b-vision-instruct:free",
     "meta-llama/llama-3.2-90b-vision-instruct:free",
-    "google/gemma-2-9b-it:free",
-}
+})
+
+# Lowercased copy for case-insensitive lookups in is_model_allowed
+_ALLOWED_LOWER = frozenset(m.lower() for m in ALLOWED_FREE_MODELS)
+
+# Response headers that indicate a request was billed (lowercase)
+_BILLING_INDICATORS = frozenset({
+    "x-billing-charged",
+    "x-cost",
+    "x-usage-cost",
+})
 
 # Daily request limit (even for free tier - prevent abuse)
 DAILY_REQUEST_LIMIT = int(os.getenv("DAILY_REQUEST_LIMIT", "500"))
 
-# Request counter storage (in-memory for simplicity, reset on restart)
-_request_counter = {
-    "date": date.today().isoformat(),
-    "count": 0
-}
+# =============================================================================
+# REQUEST COUNTER (shared across workers)
+# =============================================================================
+# With REDIS_URL set, the daily counter is a day-keyed Redis INCR, shared by
+# every worker and replica. Without it, a file guarded by flock is used so
+# workers on a single host still see one counter.
+REDIS_URL = os.getenv("REDIS_URL", "")
+REQUEST_COUNTER_FILE = os.getenv("REQUEST_COUNTER_FILE", "/tmp/ai-service-request-count")
+REQUEST_COUNTER_TTL_SECONDS = 172800  # Keep yesterday's key around for debugging
+
+# The daily-limit pre-check reuses this worker's last known count for up to
+# this long instead of reading the shared store on every request. The limit
+# itself is enforced on the (atomic) increment, so this can't overshoot it.
+REQUEST_COUNT_CACHE_SECONDS = float(os.getenv("REQUEST_COUNT_CACHE_SECONDS", "1.0"))
+
+_redis_client = None
+
+# (day, count, time.monotonic()) of the last count read from or written to the store
+_last_count: tuple[str, int, float] = ("", 0, 0.0)
+
+
+def _get_redis():
+    """Get or create the Redis client (lazy, so Redis stays optional)."""
+    global _redis_client
+    if _redis_client is None:
+        import redis.asyncio as aioredis
+        _redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+    return _redis_client
 
-def get_request_count() -> int:
-    """Get current request count, resetting if day changed."""
+
+def _update_file_counter(increment: int) -> int:
+    """Read (and optionally bump) the day's count under an exclusive file lock."""
     today = date.today().isoformat()
-    if _request_counter["date"] != today:
-        _request_counter["date"] = today
-        _request_counter["count"] = 0
-    return _request_counter["count"]
+    with open(REQUEST_COUNTER_FILE, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        stored_date, _, stored_count = f.read().partition(" ")
+        count = int(stored_count) if stored_date == today and stored_count else 0
+        if increment:
+            count += increment
+            f.seek(0)
+            f.truncate()
+            f.write(f"{today} {count}")
+        return count
+
+
+def _remember_count(day: str, count: int) -> int:
+    """Record the latest count seen by this worker and return it."""
+    global _last_count
+    _last_count = (day, count, time.monotonic())
+    return count
 
-def increment_request_count() -> int:
+
+async def get_request_count() -> int:
+    """Get current request count for today."""
+    today = date.today().isoformat()
+    if REDIS_URL:
+        value = await _get_redis().get(f"ai:req:{today}")
+        return _remember_count(today, int(value or 0))
+    # flock can wait on other workers - keep it off the event loop
+    return _remember_count(today, await asyncio.to_thread(_update_file_counter, 0))
+
+
+async def increment_request_count() -> int:
     """Increment and return new count."""
     today = date.today().isoformat()
-    if _request_counter["date"] != today:
-        _request_counter["date"] = today
-        _request_counter["count"] = 0
-    _request_counter["count"] += 1
-    return _request_counter["count"]
+    if REDIS_URL:
+        redis = _get_redis()
+        key = f"ai:req:{today}"
+        count = await redis.incr(key)
+        if count == 1:
+            await redis.expire(key, REQUEST_COUNTER_TTL_SECONDS)
+        return _remember_count(today, count)
+    return _remember_count(today, await asyncio.to_thread(_update_file_counter, 1))
 
-def is_within_daily_limit() -> bool:
-    """Check if we're within daily request limit."""
-    return get_request_count() < DAILY_REQUEST_LIMIT
+
+async def decrement_request_count() -> int:
+    """Undo an increment (for a request rejected after counting) and return the new count."""
+    today = date.today().isoformat()
+    if REDIS_URL:
+        count = await _get_redis().decr(f"ai:req:{today}")
+        return _remember_count(today, count)
+    return _remember_count(today, await asyncio.to_thread(_update_file_counter, -1))
+
+
+async def is_within_daily_limit() -> bool:
+    """
+    Check if we're within daily request limit.
+    
+    Uses this worker's last known count while it is recent. The only
+    decrements undo increments that went over the limit, so the count never
+    drops below the limit once it has reached it: a cached count at or over
+    the limit is final for the day. One under it may be stale, but the
+    increment re-checks.
+    """
+    day, count, seen_at = _last_count
+    if day == date.today().isoformat() and time.monotonic() - seen_at < REQUEST_COUNT_CACHE_SECONDS:
+        return count < DAILY_REQUEST_LIMIT
+    return await get_request_count() < DAILY_REQUEST_LIMIT
 
 # =============================================================================
 # VALIDATION THRESHOLDS
 # =============================================================================
 MIN_CONFIDENCE_THRESHOLD = float(os.getenv("MIN_CONFIDENCE_THRESHOLD", "0.7"))
 
+# =============================================================================
+# IMAGE PREPROCESSING
+# =============================================================================
+# Screenshots over IMAGE_RESIZE_MIN_BYTES or with an edge longer than
+# IMAGE_MAX_EDGE_PX are downscaled and re-encoded as JPEG before upload
+IMAGE_MAX_EDGE_PX = int(os.getenv("IMAGE_MAX_EDGE_PX", "1568"))
+IMAGE_RESIZE_MIN_BYTES = int(os.getenv("IMAGE_RESIZE_MIN_BYTES", "1000000"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+# =============================================================================
+# RESULT CACHE
+# =============================================================================
+# Successful parses (and "not a payment screenshot" results) are cached per
+# (image hash, match date) so retries and duplicate uploads skip the AI call.
+# Disabling it also skips hashing uploads (metadata.image_hash is then empty).
+PARSE_CACHE_ENABLED = os.getenv("PARSE_CACHE_ENABLED", "true").lower() == "true"
+PARSE_CACHE_MAX_SIZE = int(os.getenv("PARSE_CACHE_MAX_SIZE", "10000"))
+PARSE_CACHE_TTL_SECONDS = int(os.getenv("PARSE_CACHE_TTL_SECONDS", "3600"))
+
+# =============================================================================
+# REQUEST BATCHING
+# =============================================================================
+# When enabled, concurrent /parse-payment requests are collected for up to
+# PARSE_BATCH_MAX_WAIT_MS (or PARSE_BATCH_MAX_SIZE requests) and sent to
+# the provider as one multi-image call.
+PARSE_BATCH_ENABLED = os.getenv("PARSE_BATCH_ENABLED", "false").lower() == "true"
+PARSE_BATCH_MAX_SIZE = int(os.getenv("PARSE_BATCH_MAX_SIZE", "8"))
+PARSE_BATCH_MAX_WAIT_MS = int(os.getenv("PARSE_BATCH_MAX_WAIT_MS", "25"))
+# Batches in flight at once - extra requests wait instead of hitting rate limits
+PARSE_BATCH_CONCURRENCY = int(os.getenv("PARSE_BATCH_CONCURRENCY", "4"))
+
 # =============================================================================
 # SERVICE URLS
 # =============================================================================
@@ -96,15 +215,30 @@ BACKEND_CALLBACK_URL = os.getenv("BACKEND_CALLBACK_URL", "http://backend-service
 # =============================================================================
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
+# =============================================================================
+# SERVER
+# =============================================================================
+# Number of uvicorn worker processes (request counter is shared, see above).
+# Defaults to 1 to fit the 256Mi pod limit - scale with replicas instead.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Back-pressure and worker recycling (limits apply per worker process).
+# Requests beyond LIMIT_CONCURRENCY get a 503 instead of queuing until OOM;
+# workers restart after LIMIT_MAX_REQUESTS to shed heap fragmentation/leaks
+# (only with more than one worker - a single worker would exit for good).
+LIMIT_CONCURRENCY = int(os.getenv("LIMIT_CONCURRENCY", "64"))
+LIMIT_MAX_REQUESTS = int(os.getenv("LIMIT_MAX_REQUESTS", "10000"))
+TIMEOUT_KEEP_ALIVE = int(os.getenv("TIMEOUT_KEEP_ALIVE", "5"))
+
 # =============================================================================
 # HELPER FUNCTIONS
 # =============================================================================
 
 def is_model_allowed(model_id: str) -> bool:
-    """Check if model is in the FREE whitelist."""
-    return model_id in ALLOWED_FREE_MODELS
+    """Check if model is in the FREE whitelist (case-insensitive)."""
+    return model_id.lower() in _ALLOWED_LOWER
 
-def should_block_request(model_id: str, response_headers: dict = None) -> tuple[bool, str | None]:
+async def should_block_request(model_id: str, response_headers: dict = None) -> tuple[bool, str | None]:
     """
     Check if request should be blocked based on cost guardrails.
     
@@ -120,29 +254,23 @@ def should_block_request(model_id: str, response_headers: dict = None) -> tuple[
         return True, "model_not_free"
     
     # Check daily limit
-    if not is_within_daily_limit():
+    if not await is_within_daily_limit():
         return True, "daily_limit_exceeded"
     
     # Check for billing indicators in response (if available)
-    if response_headers:
-        billing_indicators = [
-            "x-billing-charged",
-            "x-cost",
-            "x-usage-cost",
-        ]
-        for indicator in billing_indicators:
-            if indicator.lower() in {k.lower() for k in response_headers.keys()}:
-                return True, "billing_detected"
+    if response_headers and any(k.lower() in _BILLING_INDICATORS for k in response_headers):
+        return True, "billing_detected"
     
     return False, None
 
-def get_service_status() -> dict:
+async def get_service_status() -> dict:
     """Get current service status for health checks."""
+    count = await get_request_count()
     return {
         "enabled": AI_SERVICE_ENABLED,
         "provider": AI_PROVIDER,
         "daily_limit": DAILY_REQUEST_LIMIT,
-        "requests_today": get_request_count(),
-        "requests_remaining": max(0, DAILY_REQUEST_LIMIT - get_request_count()),
+        "requests_today": count,
+        "requests_remaining": max(0, DAILY_REQUEST_LIMIT - count),
         "min_confidence_threshold": MIN_CONFIDENCE_THRESHOLD,
     }
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
-import base64
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
 import json
 import requests
 from io import BytesIO
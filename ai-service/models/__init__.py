@@ -6,6 +6,11 @@ from .schemas import (
     ParsePaymentRequest,
     HealthResponse,
     StatusResponse,
+    TransactionStatus,
+    PaymentMethod,
+    ModelCostTier,
+    ReviewReason,
+    ErrorCode,
 )
 
 __all__ = [
@@ -15,4 +20,9 @@ __all__ = [
     "ParsePaymentRequest",
     "HealthResponse",
     "StatusResponse",
+    "TransactionStatus",
+    "PaymentMethod",
+    "ModelCostTier",
+    "ReviewReason",
+    "ErrorCode",
 ]
@@ -6,9 +6,64 @@ The structure MUST remain static - only values change.
 Never add/remove fields without coordinating with frontend.
 """
 
-from pydantic import BaseModel, Field
+from enum import StrEnum
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Literal, Optional
-from datetime import datetime
+
+from utils.time_utils import iso_now
+
+
+# =============================================================================
+# ENUMS - StrEnum, so they serialize (and format) as their plain values
+# =============================================================================
+
+class TransactionStatus(StrEnum):
+    """Transaction status values."""
+    COMPLETED = "completed"
+    FAILED = "failed"
+    PENDING = "pending"
+    UNKNOWN = "unknown"
+
+
+class PaymentMethod(StrEnum):
+    """Payment method values."""
+    UPI = "UPI"
+    NEFT = "NEFT"
+    IMPS = "IMPS"
+    UNKNOWN = "unknown"
+
+
+class ModelCostTier(StrEnum):
+    """Whether the model call was free or paid."""
+    FREE = "free"
+    PAID = "paid"
+    UNKNOWN = "unknown"
+
+
+class ReviewReason(StrEnum):
+    """Reasons a result requires admin review."""
+    LOW_CONFIDENCE = "low_confidence"
+    DATE_MISMATCH = "date_mismatch"
+    AI_UNCERTAIN = "ai_uncertain"
+    NOT_PAYMENT_SCREENSHOT = "not_payment_screenshot"
+    VALIDATION_FAILED = "validation_failed"
+    SERVICE_ERROR = "service_error"
+    SERVICE_DISABLED = "service_disabled"
+    DAILY_LIMIT_EXCEEDED = "daily_limit_exceeded"
+    MODEL_NOT_FREE = "model_not_free"
+
+
+class ErrorCode(StrEnum):
+    """Error codes returned when success is false."""
+    NOT_PAYMENT_SCREENSHOT = "not_payment_screenshot"
+    PAYMENT_DATE_INVALID = "payment_date_invalid"
+    AI_FAILED = "ai_failed"
+    VALIDATION_FAILED = "validation_failed"
+    SERVICE_DISABLED = "service_disabled"
+    SERVICE_ERROR = "service_error"
+    DAILY_LIMIT_EXCEEDED = "daily_limit_exceeded"
+    MODEL_NOT_FREE = "model_not_free"
+    INVALID_IMAGE = "invalid_image"
 
 
 class PaymentData(BaseModel):
@@ -18,24 +73,31 @@ class PaymentData(BaseModel):
     CONTRACT: All fields are always present.
     Empty string for missing text fields, 0.0 for missing numbers.
     """
+    # Frozen so one instance can be shared between responses
+    model_config = ConfigDict(frozen=True)
+    
     amount: float = Field(default=0.0, description="Payment amount")
     currency: str = Field(default="INR", description="Currency code")
     payer_name: str = Field(default="", description="Name of the person who paid")
     payee_name: str = Field(default="", description="Name of the recipient")
     date: str = Field(default="", description="Payment date in YYYY-MM-DD format")
     time: str = Field(default="", description="Payment time in HH:MM:SS format")
-    transaction_status: Literal["completed", "failed", "pending", "unknown"] = Field(
-        default="unknown",
+    transaction_status: TransactionStatus = Field(
+        default=TransactionStatus.UNKNOWN,
         description="Transaction status"
     )
     transaction_id: str = Field(default="", description="UPI/Transaction reference ID")
-    payment_method: Literal["UPI", "NEFT", "IMPS", "unknown"] = Field(
-        default="unknown",
+    payment_method: PaymentMethod = Field(
+        default=PaymentMethod.UNKNOWN,
         description="Payment method used"
     )
     upi_id: str = Field(default="", description="UPI ID if available")
 
 
+# Shared by every error response - safe because PaymentData is frozen
+_EMPTY_PAYMENT_DATA = PaymentData()
+
+
 class ResponseMetadata(BaseModel):
     """
     Metadata about the parsing operation.
@@ -64,32 +126,26 @@ class ResponseMetadata(BaseModel):
         default="",
         description="Model used for parsing"
     )
-    model_cost_tier: Literal["free", "paid", "unknown"] = Field(
-        default="unknown",
+    model_cost_tier: ModelCostTier = Field(
+        default=ModelCostTier.UNKNOWN,
         description="Whether the model call was free or paid"
     )
     image_hash: str = Field(
         default="",
-        description="SHA-256 hash of the image for deduplication"
+        description="Algorithm-tagged 128-bit hash of the image for deduplication (e.g. \"b3:<hex>\" for BLAKE3)"
     )
     requires_review: bool = Field(
         default=False,
         description="Whether admin review is required"
     )
-    review_reason: Optional[Literal[
-        "low_confidence",
-        "date_mismatch", 
-        "ai_uncertain",
-        "not_payment_screenshot",
-        "validation_failed",
-        "service_error",
-        "service_disabled",
-        "daily_limit_exceeded",
-        "model_not_free"
-    ]] = Field(
+    review_reason: Optional[ReviewReason] = Field(
         default=None,
         description="Reason for requiring review"
     )
+    cache_hit: bool = Field(
+        default=False,
+        description="Whether the result was reused from an earlier identical upload"
+    )
 
 
 class ParsePaymentResponse(BaseModel):
@@ -103,17 +159,7 @@ class ParsePaymentResponse(BaseModel):
         default=False,
         description="Whether parsing was successful"
     )
-    error_code: Optional[Literal[
-        "not_payment_screenshot",
-        "payment_date_invalid",
-        "ai_failed",
-        "validation_failed",
-        "service_disabled",
-        "service_error",
-        "daily_limit_exceeded",
-        "model_not_free",
-        "invalid_image"
-    ]] = Field(
+    error_code: Optional[ErrorCode] = Field(
         default=None,
         description="Error code if success is false"
     )
@@ -143,22 +189,27 @@ class ParsePaymentResponse(BaseModel):
         processing_time_ms: int = 0,
         is_payment_screenshot: bool = False
     ) -> "ParsePaymentResponse":
-        """Factory method for creating error responses."""
-        return cls(
+        """
+        Factory method for creating error responses.
+        
+        Inputs come from server code, so validation is skipped (model_construct);
+        string codes are still converted to their enum members.
+        """
+        return cls.model_construct(
             success=False,
-            error_code=error_code,
+            error_code=ErrorCode(error_code),
             error_message=error_message,
-            data=PaymentData(),
-            metadata=ResponseMetadata(
+            data=_EMPTY_PAYMENT_DATA,
+            metadata=ResponseMetadata.model_construct(
                 confidence=0.0,
                 is_payment_screenshot=is_payment_screenshot,
                 processing_time_ms=processing_time_ms,
                 provider=provider,
                 model=model,
-                model_cost_tier=model_cost_tier,
+                model_cost_tier=ModelCostTier(model_cost_tier),
                 image_hash=image_hash,
                 requires_review=True,
-                review_reason=review_reason or error_code
+                review_reason=ReviewReason(review_reason or error_code)
             )
         )
 
@@ -175,22 +226,27 @@ class ParsePaymentResponse(BaseModel):
         requires_review: bool = False,
         review_reason: str = None
     ) -> "ParsePaymentResponse":
-        """Factory method for creating success responses."""
-        return cls(
+        """
+        Factory method for creating success responses.
+        
+        Inputs come from server code, so validation is skipped (model_construct);
+        string codes are still converted to their enum members.
+        """
+        return cls.model_construct(
             success=True,
             error_code=None,
             error_message=None,
             data=data,
-            metadata=ResponseMetadata(
+            metadata=ResponseMetadata.model_construct(
                 confidence=confidence,
                 is_payment_screenshot=True,
                 processing_time_ms=processing_time_ms,
                 provider=provider,
                 model=model,
-                model_cost_tier=model_cost_tier,
+                model_cost_tier=ModelCostTier(model_cost_tier),
                 image_hash=image_hash,
                 requires_review=requires_review,
-                review_reason=review_reason
+                review_reason=ReviewReason(review_reason) if review_reason else None
             )
         )
 
@@ -211,7 +267,7 @@ class HealthResponse(BaseModel):
     """Health check response."""
     status: Literal["healthy", "unhealthy"] = "healthy"
     service: str = "ai-service"
-    timestamp: str = Field(default_factory=lambda: datetime.utcnow().isoformat())
+    timestamp: str = Field(default_factory=iso_now)
 
 
 class StatusResponse(BaseModel):
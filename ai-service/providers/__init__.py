@@ -8,20 +8,32 @@ To add a new provider:
 3. Set AI_PROVIDER environment variable
 """
 
+import threading
+from functools import lru_cache
+from importlib import import_module
+
 from .base import AIProviderBase
-from .google_ai_studio import GoogleAIStudioProvider
 
-# Provider registry - add new providers here
+# Provider registry - add new providers here.
+# Entries are "module:Class" and only imported when the provider is created,
+# so importing this package (e.g. providers.http at startup) doesn't load AI SDKs.
 PROVIDERS = {
-    "google_ai_studio": GoogleAIStudioProvider,
-    # "openrouter": OpenRouterProvider,  # Future
+    "google_ai_studio": ".google_ai_studio:GoogleAIStudioProvider",
+    # "openrouter": ".openrouter:OpenRouterProvider",  # Future
 }
 
+# Serializes provider construction so concurrent first calls share one instance
+_provider_lock = threading.Lock()
+
 
 def get_provider(provider_name: str = None) -> AIProviderBase:
     """
     Factory function to get the configured AI provider.
     
+    Instances are cached per provider name so the underlying API client
+    (and its HTTP connection pool) is reused across requests. Thread-safe:
+    the startup warm-up builds the provider in a worker thread.
+    
     Args:
         provider_name: Optional provider name override
         
@@ -33,13 +45,28 @@ def get_provider(provider_name: str = None) -> AIProviderBase:
     """
     from config import AI_PROVIDER
     
-    name = provider_name or AI_PROVIDER
-    
+    with _provider_lock:
+        return _create_provider(provider_name or AI_PROVIDER)
+
+
+@lru_cache(maxsize=None)
+def _create_provider(name: str) -> AIProviderBase:
+    """Build a provider by registry name (cached - call via get_provider)."""
     if name not in PROVIDERS:
         available = ", ".join(PROVIDERS.keys())
         raise ValueError(f"Unknown provider '{name}'. Available: {available}")
     
-    return PROVIDERS[name]()
+    module_name, class_name = PROVIDERS[name].split(":")
+    provider_class = getattr(import_module(module_name, __name__), class_name)
+    return provider_class()
+
+
+def __getattr__(name: str):
+    """Lazily import provider classes exported from this package."""
+    if name == "GoogleAIStudioProvider":
+        from .google_ai_studio import GoogleAIStudioProvider
+        return GoogleAIStudioProvider
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 __all__ = [
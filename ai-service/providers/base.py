@@ -5,13 +5,45 @@ All AI providers must implement this interface.
 This ensures consistent behavior and easy provider switching.
 """
 
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+# Default payment extraction prompt (see AIProviderBase.get_payment_extraction_prompt)
+PAYMENT_EXTRACTION_PROMPT = """You are analyzing an image. First determine if this is a UPI/bank payment screenshot.
+
+If this is NOT a payment screenshot (e.g., selfie, document, random image, chat screenshot), respond with ONLY this JSON:
+{"is_payment_screenshot": false, "detected_type": "describe what the image is"}
+
+If this IS a payment screenshot, extract the following information and respond with ONLY valid JSON (no markdown, no explanation):
+{
+    "is_payment_screenshot": true,
+    "amount": <number - the payment amount, use 0 if not found>,
+    "currency": "INR",
+    "payer_name": "<string - name of person who paid, empty string if not found>",
+    "payee_name": "<string - name of recipient, empty string if not found>",
+    "date": "<string in YYYY-MM-DD format, empty string if not found>",
+    "time": "<string in HH:MM:SS format, empty string if not found>",
+    "transaction_status": "<completed|failed|pending|unknown>",
+    "transaction_id": "<string - UPI ref or transaction ID, empty string if not found>",
+    "payment_method": "<UPI|NEFT|IMPS|unknown>",
+    "upi_id": "<string - UPI ID if visible, empty string if not found>",
+    "confidence": <number between 0 and 1 indicating how confident you are>
+}
+
+Important rules:
+1. Return ONLY the JSON object, no other text
+2. All string fields should be empty strings "" if not found, never null
+3. Amount should be 0 if not clearly visible
+4. Date must be in YYYY-MM-DD format
+5. Time must be in HH:MM:SS format (use 00:00:00 if only date is visible)
+6. Be conservative with confidence - if anything is unclear, lower the confidence"""
+
+
 class AIProviderBase(ABC):
     """
     Abstract base class for AI providers.
@@ -55,14 +87,14 @@ class AIProviderBase(ABC):
     @abstractmethod
     async def parse_payment_image(
         self,
-        image_base64: str,
+        image_bytes: bytes,
         match_date: Optional[str] = None
     ) -> dict:
         """
         Parse a payment screenshot and extract structured data.
         
         Args:
-            image_base64: Base64 encoded image
+            image_bytes: Decoded image data
             match_date: Optional match date for validation
             
         Returns:
@@ -80,11 +112,32 @@ class AIProviderBase(ABC):
                     "transaction_id": str,
                     "payment_method": str,
                     "upi_id": str,
-                    "raw_response": str  # For debugging
+                    "raw_response": str  # Optional - debugging only
                 }
         """
         pass
     
+    async def parse_payment_image_batch(
+        self,
+        images: List[Tuple[bytes, Optional[str]]]
+    ) -> List[dict]:
+        """
+        Parse several payment screenshots.
+        
+        Override in subclass to send all images in one provider request.
+        The default implementation calls parse_payment_image concurrently.
+        
+        Args:
+            images: List of (image_bytes, match_date) tuples
+            
+        Returns:
+            List of dicts (same structure as parse_payment_image), in order
+        """
+        return list(await asyncio.gather(*(
+            self.parse_payment_image(image_bytes, match_date)
+            for image_bytes, match_date in images
+        )))
+    
     @abstractmethod
     async def check_billing_status(self) -> dict:
         """
@@ -107,31 +160,20 @@ class AIProviderBase(ABC):
         Returns:
             str: Prompt text
         """
-        return """You are analyzing an image. First determine if this is a UPI/bank payment screenshot.
+        return PAYMENT_EXTRACTION_PROMPT
+    
+    def get_batch_extraction_prompt(self, image_count: int) -> str:
+        """
+        Get the prompt for extracting payments from several images at once.
+        
+        Args:
+            image_count: Number of images attached to the request
+            
+        Returns:
+            str: Prompt text
+        """
+        return f"""You will receive {image_count} images, in order. Apply the instructions below to EACH image separately.
 
-If this is NOT a payment screenshot (e.g., selfie, document, random image, chat screenshot), respond with ONLY this JSON:
-{"is_payment_screenshot": false, "detected_type": "describe what the image is"}
+Respond with ONLY a JSON array containing exactly {image_count} objects, one per image, in the same order as the images. Each object must follow the format described below.
 
-If this IS a payment screenshot, extract the following information and respond with ONLY valid JSON (no markdown, no explanation):
-{
-    "is_payment_screenshot": true,
-    "amount": <number - the payment amount, use 0 if not found>,
-    "currency": "INR",
-    "payer_name": "<string - name of person who paid, empty string if not found>",
-    "payee_name": "<string - name of recipient, empty string if not found>",
-    "date": "<string in YYYY-MM-DD format, empty string if not found>",
-    "time": "<string in HH:MM:SS format, empty string if not found>",
-    "transaction_status": "<completed|failed|pending|unknown>",
-    "transaction_id": "<string - UPI ref or transaction ID, empty string if not found>",
-    "payment_method": "<UPI|NEFT|IMPS|unknown>",
-    "upi_id": "<string - UPI ID if visible, empty string if not found>",
-    "confidence": <number between 0 and 1 indicating how confident you are>
-}
-
-Important rules:
-1. Return ONLY the JSON object, no other text
-2. All string fields should be empty strings "" if not found, never null
-3. Amount should be 0 if not clearly visible
-4. Date must be in YYYY-MM-DD format
-5. Time must be in HH:MM:SS format (use 00:00:00 if only date is visible)
-6. Be conservative with confidence - if anything is unclear, lower the confidence"""
+{self.get_payment_extraction_prompt()}"""
@@ -5,23 +5,60 @@ Implementation for Google's Generative AI (Gemini) models.
 Uses the free tier models only.
 """
 
-import json
-import base64
+import re
+import asyncio
 import logging
-from typing import Optional
+from typing import List, Optional, Tuple
 
+import orjson
+from aiolimiter import AsyncLimiter
 import google.genai as genai
 from google.genai import types
 
 from .base import AIProviderBase
+from .http import get_http_session
 from config import (
     GOOGLE_AI_STUDIO_API_KEY,
+    GOOGLE_AI_STUDIO_MAX_CONCURRENCY,
+    GOOGLE_AI_STUDIO_RPM,
     ALLOWED_FREE_MODELS,
     is_model_allowed,
 )
 
 logger = logging.getLogger(__name__)
 
+# Markdown fence around a reply: opening ```json (or bare ```) and closing ```,
+# either of which may be missing
+_CODE_FENCE_RE = re.compile(r"^(?:```[\w-]*)?\s*(.*?)\s*(?:```)?$", re.DOTALL)
+
+# Magic-byte prefixes for MIME detection (WEBP is checked at offset 8)
+_MIME_BY_PREFIX = (
+    (b'\x89PNG', "image/png"),
+    (b'\xFF\xD8\xFF', "image/jpeg"),
+    (b'GIF', "image/gif"),
+)
+
+# Fallback models for parse_payment_image, in order - filtered once at import
+# since the free-model whitelist is fixed for the life of the process
+_FALLBACK_MODELS = tuple(
+    model_id for model_id in (
+        "gemma-3-27b-it",  # Try Gemma first
+        "gemini-2.0-flash-exp",
+        "gemini-2.0-flash",
+        "gemini-2.0-flash-lite",
+        "gemini-1.5-flash",  # Fallback to older
+        "gemini-1.5-pro",
+    )
+    if is_model_allowed(model_id)
+)
+
+
+def _as_str(value, default: str = "") -> str:
+    """Coerce a decoded JSON value to str - str values pass through as-is, null becomes default."""
+    if value is None:
+        return default
+    return value if type(value) is str else str(value)
+
 
 class GoogleAIStudioProvider(AIProviderBase):
     """
@@ -34,12 +71,14 @@ class GoogleAIStudioProvider(AIProviderBase):
     # Using Gemma-3-27B-IT for better reasoning and multilingual support
     DEFAULT_MODEL = "gemma-3-27b-it"
     
-    def __init__(self, model_id: str = None):
+    def __init__(self, model_id: str = None, http_session=None):
         """
         Initialize the Google AI Studio provider.
         
         Args:
             model_id: Optional model override (must be in free list)
+            http_session: Optional aiohttp session for async calls
+                (defaults to the app-wide session from providers.http)
         """
         self._model_id = model_id or self.DEFAULT_MODEL
         
@@ -53,10 +92,18 @@ class GoogleAIStudioProvider(AIProviderBase):
         
         # Configure the API
         if GOOGLE_AI_STUDIO_API_KEY:
-            self._client = genai.Client(api_key=GOOGLE_AI_STUDIO_API_KEY)
+            http_session = http_session or get_http_session()
+            self._client = genai.Client(
+                api_key=GOOGLE_AI_STUDIO_API_KEY,
+                http_options=types.HttpOptions(aiohttp_client=http_session) if http_session else None,
+            )
         else:
             logger.warning("GOOGLE_AI_STUDIO_API_KEY not set")
             self._client = None
+        
+        # Back-pressure for generate_content - excess calls queue instead of hitting 429s
+        self._concurrency = asyncio.Semaphore(GOOGLE_AI_STUDIO_MAX_CONCURRENCY)
+        self._rate_limiter = AsyncLimiter(GOOGLE_AI_STUDIO_RPM, 60)
     
     def get_model_id(self) -> str:
         return self._model_id
@@ -67,24 +114,36 @@ class GoogleAIStudioProvider(AIProviderBase):
     def is_free_tier(self) -> bool:
         return is_model_allowed(self._model_id)
     
-    def _get_working_model(self, model_id: str):
-        """Get a specific model instance."""
-        try:
-            return genai.GenerativeModel(model_id)
-        except Exception as e:
-            logger.warning(f"Model {model_id} instantiation failed: {e}")
-            return None
+    async def list_models(self) -> List[dict]:
+        """
+        List models available to this API key that support generateContent.
+        
+        Returns:
+            List of dicts with name, display_name and description
+        """
+        if self._client is None:
+            raise RuntimeError("GOOGLE_AI_STUDIO_API_KEY not set")
+        
+        models = []
+        async for model in await self._client.aio.models.list():
+            if "generateContent" in (model.supported_actions or []):
+                models.append({
+                    "name": model.name,
+                    "display_name": model.display_name,
+                    "description": model.description,
+                })
+        return models
     
     async def parse_payment_image(
         self,
-        image_base64: str,
+        image_bytes: bytes,
         match_date: Optional[str] = None
     ) -> dict:
         """
         Parse payment screenshot using Gemini vision.
         
         Args:
-            image_base64: Base64 encoded image
+            image_bytes: Decoded image data
             match_date: Optional match date for validation
             
         Returns:
@@ -92,26 +151,7 @@ class GoogleAIStudioProvider(AIProviderBase):
         """
         # Prepare image data once
         try:
-            # Decode base64 to get image bytes
-            if "," in image_base64:
-                image_base64 = image_base64.split(",")[1]
-            image_bytes = base64.b64decode(image_base64)
-            
-            # Detect image type from magic bytes
-            mime_type = "image/jpeg"  # default
-            if image_bytes.startswith(b'\x89PNG'):
-                mime_type = "image/png"
-            elif image_bytes.startswith(b'\xFF\xD8\xFF'):
-                mime_type = "image/jpeg"
-            elif image_bytes.startswith(b'GIF'):
-                mime_type = "image/gif"
-            elif image_bytes.startswith(b'WEBP', 8):
-                mime_type = "image/webp"
-            
-            image_part = {
-                "mime_type": mime_type,
-                "data": image_bytes
-            }
+            image_part = self._prepare_image_part(image_bytes)
         except Exception as e:
             logger.error(f"Error preparing image data: {e}")
             return {
@@ -120,24 +160,10 @@ class GoogleAIStudioProvider(AIProviderBase):
                 "confidence": 0.0,
             }
 
-        # List of models to try in order
-        models_to_try = [self._model_id]
-        
-        # Add fallbacks - Updated model names for new Google Gen AI API
-        fallbacks = [
-            "gemma-3-27b-it", # Try Gemma first
-            "gemini-2.0-flash-exp",
-            "gemini-2.0-flash", 
-            "gemini-2.0-flash-lite",
-            "gemini-1.5-flash", # Fallback to older
-            "gemini-1.5-pro",
-        ]
-        
-        # Dedup preserving order
-        for fb in fallbacks:
-            if fb not in models_to_try:
-                models_to_try.append(fb)
+        # Models to try in order - current model first, then the fallbacks
+        models_to_try = (self._model_id, *(m for m in _FALLBACK_MODELS if m != self._model_id))
         
+        prompt = self.get_payment_extraction_prompt()
         last_error = None
         
         for model_id in models_to_try:
@@ -151,11 +177,8 @@ class GoogleAIStudioProvider(AIProviderBase):
                 # Update current model ID for status checks
                 self._model_id = model_id
                 
-                # Get prompt
-                prompt = self.get_payment_extraction_prompt()
-                
                 # Generate content
-                response = await self._generate_content_with_model(model_id, prompt, image_part)
+                response = await self._generate_content_with_model(model_id, prompt, [image_part])
                 
                 # If we got here, it worked!
                 logger.info(f"✅ Success with model: {model_id}")
@@ -173,7 +196,61 @@ class GoogleAIStudioProvider(AIProviderBase):
             "confidence": 0.0,
         }
     
-    async def _generate_content_with_model(self, model_id: str, prompt: str, image_part: dict) -> str:
+    async def parse_payment_image_batch(
+        self,
+        images: List[Tuple[bytes, Optional[str]]]
+    ) -> List[dict]:
+        """
+        Parse several payment screenshots in a single Gemini request.
+        
+        Falls back to one request per image if the combined call fails or
+        the reply does not contain exactly one result per image.
+        
+        Args:
+            images: List of (image_bytes, match_date) tuples
+            
+        Returns:
+            List of parsed payment dicts, in the same order as images
+        """
+        if len(images) > 1 and self._client is not None:
+            try:
+                prompt = self.get_batch_extraction_prompt(len(images))
+                image_parts = [self._prepare_image_part(image_bytes) for image_bytes, _ in images]
+                response = await self._generate_content_with_model(self._model_id, prompt, image_parts)
+                results = self._parse_ai_batch_response(response, len(images))
+                if results is not None:
+                    logger.info(f"✅ Parsed batch of {len(images)} images with model: {self._model_id}")
+                    return results
+            except Exception as e:
+                logger.warning(f"Batch request for {len(images)} images failed: {e}")
+        
+        return await super().parse_payment_image_batch(images)
+    
+    def _prepare_image_part(self, image_bytes: bytes) -> dict:
+        """
+        Detect the MIME type of an image and wrap it as an inline part.
+        
+        Args:
+            image_bytes: Decoded image data
+            
+        Returns:
+            dict: {"mime_type": str, "data": bytes}
+        """
+        # Detect image type from magic bytes (JPEG if nothing matches)
+        if image_bytes.startswith(b'WEBP', 8):
+            mime_type = "image/webp"
+        else:
+            mime_type = next(
+                (mime for prefix, mime in _MIME_BY_PREFIX if image_bytes.startswith(prefix)),
+                "image/jpeg",
+            )
+        
+        return {
+            "mime_type": mime_type,
+            "data": image_bytes
+        }
+    
+    async def _generate_content_with_model(self, model_id: str, prompt: str, image_parts: List[dict]) -> str:
         """
         Generate content using a specific Gemini model with new API.
         """
@@ -183,23 +260,28 @@ class GoogleAIStudioProvider(AIProviderBase):
                 types.Content(
                     parts=[
                         types.Part.from_text(text=prompt),
-                        types.Part.from_bytes(
-                            data=image_part["data"],
-                            mime_type=image_part["mime_type"]
+                        *(
+                            types.Part.from_bytes(
+                                data=image_part["data"],
+                                mime_type=image_part["mime_type"]
+                            )
+                            for image_part in image_parts
                         )
                     ]
                 )
             ]
             
-            # Generate content using new API
-            response = self._client.models.generate_content(
-                model=model_id,
-                contents=contents,
-                config=types.GenerateContentConfig(
-                    temperature=0.1,
-                    max_output_tokens=1024,
+            # Generate content using the SDK's native async client so the
+            # event loop keeps serving other requests during the API call
+            async with self._concurrency, self._rate_limiter:
+                response = await self._client.aio.models.generate_content(
+                    model=model_id,
+                    contents=contents,
+                    config=types.GenerateContentConfig(
+                        temperature=0.1,
+                        max_output_tokens=1024 * len(image_parts),
+                    )
                 )
-            )
             
             return response.text
             
@@ -207,49 +289,23 @@ class GoogleAIStudioProvider(AIProviderBase):
             logger.error(f"Error generating content with {model_id}: {e}")
             raise
     
-    def _parse_ai_response(self, response_text: str) -> dict:
+    def _parse_ai_response(self, response_text: str, include_raw: bool = False) -> dict:
         """
         Parse the AI response text into structured data.
         
         Args:
             response_text: Raw text from AI model
+            include_raw: Also return the raw text as "raw_response" (debugging)
             
         Returns:
             dict: Parsed data
         """
         try:
-            # Clean up response - remove markdown code blocks if present
-            text = response_text.strip()
-            if text.startswith("```"):
-                # Remove opening ```json or ```
-                lines = text.split("\n")
-                text = "\n".join(lines[1:])
-            if text.endswith("```"):
-                text = text[:-3]
-            text = text.strip()
-            
             # Parse JSON
-            data = json.loads(text)
-            
-            # Ensure all required fields exist with defaults
-            return {
-                "is_payment_screenshot": data.get("is_payment_screenshot", False),
-                "confidence": float(data.get("confidence", 0.0)),
-                "amount": float(data.get("amount", 0)),
-                "currency": str(data.get("currency", "INR")),
-                "payer_name": str(data.get("payer_name", "")),
-                "payee_name": str(data.get("payee_name", "")),
-                "date": str(data.get("date", "")),
-                "time": str(data.get("time", "")),
-                "transaction_status": str(data.get("transaction_status", "unknown")),
-                "transaction_id": str(data.get("transaction_id", "")),
-                "payment_method": str(data.get("payment_method", "unknown")),
-                "upi_id": str(data.get("upi_id", "")),
-                "detected_type": data.get("detected_type", ""),
-                "raw_response": response_text,
-            }
+            data = orjson.loads(self._strip_code_fence(response_text))
+            return self._normalize_ai_data(data, response_text if include_raw else None)
             
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Failed to parse AI response as JSON: {e}")
             logger.error(f"Response was: {response_text[:500]}")
             return {
@@ -259,6 +315,63 @@ class GoogleAIStudioProvider(AIProviderBase):
                 "raw_response": response_text,
             }
     
+    def _parse_ai_batch_response(
+        self,
+        response_text: str,
+        expected_count: int,
+        include_raw: bool = False
+    ) -> Optional[List[dict]]:
+        """
+        Parse a batch response (JSON array, one object per image).
+        
+        Args:
+            response_text: Raw text from AI model
+            expected_count: Number of images sent in the request
+            include_raw: Also return the raw text as "raw_response" (debugging)
+            
+        Returns:
+            List of parsed dicts, or None if the reply can't be matched to the images
+        """
+        try:
+            data = orjson.loads(self._strip_code_fence(response_text))
+        except orjson.JSONDecodeError as e:
+            logger.warning(f"Failed to parse batch AI response as JSON: {e}")
+            return None
+        
+        if not isinstance(data, list) or len(data) != expected_count or not all(isinstance(item, dict) for item in data):
+            logger.warning(f"Batch AI response did not contain {expected_count} result objects")
+            return None
+        
+        raw_response = response_text if include_raw else None
+        return [self._normalize_ai_data(item, raw_response) for item in data]
+    
+    def _strip_code_fence(self, response_text: str) -> str:
+        """Remove markdown code blocks around a JSON reply, if present."""
+        text = response_text.strip()
+        match = _CODE_FENCE_RE.match(text)
+        return match.group(1) if match else text
+    
+    def _normalize_ai_data(self, data: dict, raw_response: Optional[str] = None) -> dict:
+        """Ensure all required fields exist with defaults."""
+        result = {
+            "is_payment_screenshot": data.get("is_payment_screenshot", False),
+            "confidence": float(data.get("confidence", 0.0)),
+            "amount": float(data.get("amount", 0)),
+            "currency": _as_str(data.get("currency"), "INR"),
+            "payer_name": _as_str(data.get("payer_name")),
+            "payee_name": _as_str(data.get("payee_name")),
+            "date": _as_str(data.get("date")),
+            "time": _as_str(data.get("time")),
+            "transaction_status": _as_str(data.get("transaction_status"), "unknown"),
+            "transaction_id": _as_str(data.get("transaction_id")),
+            "payment_method": _as_str(data.get("payment_method"), "unknown"),
+            "upi_id": _as_str(data.get("upi_id")),
+            "detected_type": data.get("detected_type", ""),
+        }
+        if raw_response is not None:
+            result["raw_response"] = raw_response
+        return result
+    
     async def check_billing_status(self) -> dict:
         """
         Check billing status for Google AI Studio.
@@ -0,0 +1,56 @@
+"""
+Shared HTTP Session
+
+One aiohttp session per process, opened in the FastAPI lifespan and
+handed to the provider SDK clients so every AI call reuses the same
+connection pool and DNS cache.
+"""
+
+import logging
+from typing import Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+async def open_http_session() -> aiohttp.ClientSession:
+    """
+    Create the shared session (call once at app startup).
+
+    Returns:
+        aiohttp.ClientSession shared by all providers
+    """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=0,                # No pool cap - uvicorn's limit_concurrency bounds load
+            ttl_dns_cache=300,
+            keepalive_timeout=75,
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+        logger.info("Opened shared HTTP session")
+    return _session
+
+
+def get_http_session() -> Optional[aiohttp.ClientSession]:
+    """
+    Get the shared session, if it has been opened.
+
+    Returns:
+        The open session, or None (e.g. when running outside the app)
+    """
+    if _session is None or _session.closed:
+        return None
+    return _session
+
+
+async def close_http_session():
+    """Close the shared session (call once at app shutdown)."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("Closed shared HTTP session")
+    _session = None
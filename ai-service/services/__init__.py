@@ -1,10 +1,12 @@
 """Services package."""
 from .payment_parser import PaymentParserService
 from .image_validator import ImageValidator
+from .image_normalizer import ImageNormalizer
 from .date_validator import DateValidator
 
 __all__ = [
     "PaymentParserService",
     "ImageValidator",
+    "ImageNormalizer",
     "DateValidator",
 ]
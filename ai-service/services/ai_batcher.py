@@ -0,0 +1,139 @@
+"""
+AI Request Batcher
+
+Coalesces concurrent single-item calls into batches. Callers await
+process(item) as if it were a direct call; a background task groups
+queued items for up to max_queue_time (or max_batch_size items) and hands
+each group to process_batch. A semaphore bounds how many batches are in
+flight, so a burst queues up here instead of turning into provider 429s.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Generic, List, Optional, Set, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class AsyncBatcher(Generic[T, R]):
+    """
+    Short-window micro-batcher in front of a batch-capable async function.
+    """
+    
+    def __init__(
+        self,
+        process_batch: Callable[[List[T]], Awaitable[List[R]]],
+        max_batch_size: int = 8,
+        max_queue_time: float = 0.1,
+        concurrency: int = 4,
+    ):
+        """
+        Initialize the batcher.
+        
+        Args:
+            process_batch: Async function returning one result per item, in order
+            max_batch_size: Maximum items per batch
+            max_queue_time: Seconds to wait for more items after the first one
+            concurrency: Maximum batches processed at the same time
+        """
+        self._process_batch = process_batch
+        self._max_batch_size = max_batch_size
+        self._max_queue_time = max_queue_time
+        self._concurrency = concurrency
+        self._queue: "asyncio.Queue[Tuple[T, asyncio.Future]]" = asyncio.Queue()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+    
+    async def process(self, item: T) -> R:
+        """
+        Submit one item and wait for its result.
+        
+        Args:
+            item: Item to add to the next batch
+        
+        Returns:
+            The result process_batch produced for this item
+        """
+        if self._worker is None or self._worker.done():
+            # Started lazily so the batcher can be built outside the event loop
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+            self._worker = asyncio.create_task(self._run())
+        
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, fut))
+        return await fut
+    
+    async def close(self):
+        """Stop the background worker and any batches still running."""
+        tasks = [task for task in [self._worker, *self._tasks] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker = None
+        
+        # Items that never made it into a batch
+        while not self._queue.empty():
+            self._fail([self._queue.get_nowait()])
+    
+    async def _run(self):
+        """Group queued items into batches; each batch runs as its own task."""
+        while True:
+            items = await self._drain()
+            try:
+                await self._semaphore.acquire()
+            except asyncio.CancelledError:
+                self._fail(items)
+                raise
+            task = asyncio.create_task(self._run_batch(items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _drain(self) -> List[Tuple[T, asyncio.Future]]:
+        """Wait for one item, then collect more until the batch is full or the window closes."""
+        items = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._max_queue_time
+        
+        try:
+            while len(items) < self._max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            self._fail(items)
+            raise
+        
+        return items
+    
+    def _fail(self, items: List[Tuple[T, asyncio.Future]], error: Exception = None):
+        """Resolve every still-pending caller future with an error."""
+        for _, fut in items:
+            if not fut.done():
+                fut.set_exception(error or RuntimeError("Request batcher closed"))
+    
+    async def _run_batch(self, items: List[Tuple[T, asyncio.Future]]):
+        """Process one batch and resolve each item's future."""
+        try:
+            logger.info(f"Dispatching batch of {len(items)} item(s)")
+            results = await self._process_batch([item for item, _ in items])
+            if len(results) != len(items):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(items)} items")
+            for (_, fut), result in zip(items, results):
+                if not fut.done():
+                    fut.set_result(result)
+        except asyncio.CancelledError:
+            # Closed mid-batch - don't leave callers waiting forever
+            self._fail(items)
+            raise
+        except Exception as e:
+            self._fail(items, e)
+        finally:
+            self._semaphore.release()
@@ -5,14 +5,18 @@ Validates payment dates against match dates.
 Flags for review if payment date is older than match date.
 """
 
+import re
 import logging
-from datetime import datetime, date
+from datetime import date
 from typing import Tuple, Optional
 
 from dateutil import parser as date_parser
 
 logger = logging.getLogger(__name__)
 
+# YYYY-MM-DD at the start of the string (the ISO fast path's input shape)
+_ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
 
 class DateValidator:
     """
@@ -33,11 +37,17 @@ class DateValidator:
         if not date_string:
             return None
         
+        # Fast path: ISO dates (YYYY-MM-DD, optionally followed by a time)
+        try:
+            return date.fromisoformat(date_string[:10])
+        except ValueError:
+            if _ISO_DATE_RE.match(date_string):
+                # ISO-shaped but invalid (e.g. month 13) - a fuzzy parse would
+                # only guess some other date
+                logger.warning(f"Failed to parse date '{date_string}': invalid ISO date")
+                return None
+        
         try:
-            # Handle YYYY-MM-DD format directly
-            if len(date_string) == 10 and date_string[4] == "-" and date_string[7] == "-":
-                return datetime.strptime(date_string, "%Y-%m-%d").date()
-            
             # Use dateutil for flexible parsing
             parsed = date_parser.parse(date_string, fuzzy=True)
             return parsed.date()
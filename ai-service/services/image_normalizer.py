@@ -0,0 +1,91 @@
+"""
+Image Normalizer Service
+
+Downscales oversized screenshots before they are sent to the AI provider.
+Gemini resizes large images internally anyway, so uploading the full
+resolution only costs bandwidth and input tokens.
+"""
+
+import logging
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from config import (
+    IMAGE_MAX_EDGE_PX,
+    IMAGE_RESIZE_MIN_BYTES,
+    IMAGE_JPEG_QUALITY,
+)
+from utils.image_utils import parse_image_header
+
+logger = logging.getLogger(__name__)
+
+
+class ImageNormalizer:
+    """
+    Shrinks images that are larger than the provider needs.
+    """
+    
+    @classmethod
+    def needs_resize(cls, image_bytes: bytes) -> bool:
+        """
+        Check whether an image is worth re-encoding.
+        
+        Args:
+            image_bytes: Raw image data
+        
+        Returns:
+            True if the image is over the byte or edge-length limit
+        """
+        if len(image_bytes) > IMAGE_RESIZE_MIN_BYTES:
+            return True
+        header = parse_image_header(image_bytes)
+        return header is not None and max(header[1], header[2]) > IMAGE_MAX_EDGE_PX
+    
+    @classmethod
+    def normalize(cls, image_bytes: bytes) -> bytes:
+        """
+        Downscale and re-encode an oversized image as JPEG.
+        
+        Images within limits are returned unchanged, as is the original
+        if re-encoding fails or doesn't make it smaller.
+        
+        Args:
+            image_bytes: Raw (already validated) image data
+        
+        Returns:
+            Image bytes to send to the provider
+        """
+        if not cls.needs_resize(image_bytes):
+            return image_bytes
+        
+        try:
+            image = Image.open(BytesIO(image_bytes))
+            # Phone photos carry their rotation in EXIF - apply it before dropping metadata
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((IMAGE_MAX_EDGE_PX, IMAGE_MAX_EDGE_PX), Image.Resampling.LANCZOS)
+            
+            # JPEG has no alpha channel - flatten transparent screenshots onto white
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+            
+            buffer = BytesIO()
+            image.save(buffer, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+            resized = buffer.getvalue()
+        except Exception as e:
+            logger.warning(f"Image downscale failed, sending original: {e}")
+            return image_bytes
+        
+        if len(resized) >= len(image_bytes):
+            return image_bytes
+        
+        logger.info(
+            f"Downscaled image to {image.size[0]}x{image.size[1]} "
+            f"({len(image_bytes) // 1024}KB -> {len(resized) // 1024}KB)"
+        )
+        return resized
@@ -5,13 +5,14 @@ Validates images before sending to AI provider.
 Performs basic checks to catch obvious non-payment images early.
 """
 
-import base64
 import logging
 from io import BytesIO
 from typing import Tuple, Optional
 
 from PIL import Image
 
+from utils.image_utils import decode_image_base64, parse_image_header
+
 logger = logging.getLogger(__name__)
 
 
@@ -21,7 +22,8 @@ class ImageValidator:
     """
     
     # Supported image formats
-    SUPPORTED_FORMATS = {"JPEG", "PNG", "GIF", "WEBP"}
+    SUPPORTED_FORMATS: frozenset = frozenset({"JPEG", "PNG", "GIF", "WEBP"})
+    _SUPPORTED_FORMATS_LABEL = ", ".join(sorted(SUPPORTED_FORMATS))
     
     # Size limits
     MIN_WIDTH = 100
@@ -29,6 +31,9 @@ class ImageValidator:
     MAX_WIDTH = 4096
     MAX_HEIGHT = 4096
     MAX_FILE_SIZE_MB = 10
+    # Longest base64 string that can decode to MAX_FILE_SIZE_MB (4 chars per
+    # 3 bytes, plus padding and room for a data URL header)
+    MAX_BASE64_LENGTH = (MAX_FILE_SIZE_MB * 1024 * 1024 * 4 // 3) + 4 + 200
     
     @classmethod
     def validate(cls, image_base64: str) -> Tuple[bool, Optional[str]]:
@@ -41,34 +46,72 @@ class ImageValidator:
         Returns:
             Tuple of (is_valid, error_message)
         """
+        is_valid, error = cls.validate_encoded_size(image_base64)
+        if not is_valid:
+            return is_valid, error
+        
         try:
-            # Handle data URL format
-            if "," in image_base64:
-                image_base64 = image_base64.split(",")[1]
+            image_bytes = decode_image_base64(image_base64)
+        except Exception as e:
+            return False, f"Invalid base64 encoding: {e}"
+        
+        return cls.validate_bytes(image_bytes)
+    
+    @classmethod
+    def validate_encoded_size(cls, image_base64: str) -> Tuple[bool, Optional[str]]:
+        """
+        Reject payloads that are too large from their length alone.
+        
+        Runs before the image is decoded, so an oversized upload costs
+        nothing to turn away. validate_bytes still checks the exact size.
+        
+        Args:
+            image_base64: Base64 encoded image data
             
-            # Decode base64
-            try:
-                image_bytes = base64.b64decode(image_base64)
-            except Exception as e:
-                return False, f"Invalid base64 encoding: {e}"
+        Returns:
+            Tuple of (is_valid, error_message)
+        """
+        if len(image_base64) > cls.MAX_BASE64_LENGTH:
+            size_mb = len(image_base64) * 3 / 4 / (1024 * 1024)
+            return False, f"Image too large: {size_mb:.1f}MB (max {cls.MAX_FILE_SIZE_MB}MB)"
+        return True, None
+    
+    @classmethod
+    def validate_bytes(cls, image_bytes: bytes) -> Tuple[bool, Optional[str]]:
+        """
+        Validate already-decoded image bytes for processing.
+        
+        Args:
+            image_bytes: Raw image data
             
+        Returns:
+            Tuple of (is_valid, error_message)
+        """
+        try:
             # Check file size
             size_mb = len(image_bytes) / (1024 * 1024)
             if size_mb > cls.MAX_FILE_SIZE_MB:
                 return False, f"Image too large: {size_mb:.1f}MB (max {cls.MAX_FILE_SIZE_MB}MB)"
             
-            # Open and validate with PIL
-            try:
-                image = Image.open(BytesIO(image_bytes))
-            except Exception as e:
-                return False, f"Cannot open image: {e}"
+            # Read format and dimensions from the header; only fall back to
+            # PIL for anything the header parser doesn't recognise
+            header = parse_image_header(image_bytes)
+            if header is not None:
+                image_format, width, height = header
+            else:
+                try:
+                    image = Image.open(BytesIO(image_bytes))
+                    image.verify()
+                except Exception as e:
+                    return False, f"Cannot open image: {e}"
+                image_format = image.format
+                width, height = image.size
             
             # Check format
-            if image.format not in cls.SUPPORTED_FORMATS:
-                return False, f"Unsupported format: {image.format}. Supported: {cls.SUPPORTED_FORMATS}"
+            if image_format not in cls.SUPPORTED_FORMATS:
+                return False, f"Unsupported format: {image_format}. Supported: {cls._SUPPORTED_FORMATS_LABEL}"
             
             # Check dimensions
-            width, height = image.size
             
             if width < cls.MIN_WIDTH or height < cls.MIN_HEIGHT:
                 return False, f"Image too small: {width}x{height} (min {cls.MIN_WIDTH}x{cls.MIN_HEIGHT})"
@@ -100,10 +143,7 @@ class ImageValidator:
             dict with image information
         """
         try:
-            if "," in image_base64:
-                image_base64 = image_base64.split(",")[1]
-            
-            image_bytes = base64.b64decode(image_base64)
+            image_bytes = decode_image_base64(image_base64)
             image = Image.open(BytesIO(image_bytes))
             
             return {
@@ -6,29 +6,84 @@ Handles validation, AI provider calls, and response formatting.
 """
 
 import time
+import asyncio
 import logging
-from typing import Optional
+from dataclasses import dataclass
+from functools import cached_property
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from cachetools import TTLCache
 
 from models.schemas import (
+    ErrorCode,
     ParsePaymentResponse,
     PaymentData,
-    ResponseMetadata,
+    PaymentMethod,
+    TransactionStatus,
 )
-from providers import get_provider, AIProviderBase
+from services.ai_batcher import AsyncBatcher
 from services.image_validator import ImageValidator
+from services.image_normalizer import ImageNormalizer
 from services.date_validator import DateValidator
-from utils.image_utils import generate_image_hash
+from utils.image_utils import decode_image_base64, generate_image_hash
 from config import (
     AI_SERVICE_ENABLED,
     should_block_request,
     increment_request_count,
-    get_request_count,
+    decrement_request_count,
     MIN_CONFIDENCE_THRESHOLD,
     DAILY_REQUEST_LIMIT,
+    PARSE_CACHE_ENABLED,
+    PARSE_CACHE_MAX_SIZE,
+    PARSE_CACHE_TTL_SECONDS,
+    PARSE_BATCH_ENABLED,
+    PARSE_BATCH_MAX_SIZE,
+    PARSE_BATCH_MAX_WAIT_MS,
+    PARSE_BATCH_CONCURRENCY,
 )
 
+if TYPE_CHECKING:
+    from providers import AIProviderBase
+
 logger = logging.getLogger(__name__)
 
+# AI wording -> allowed transaction_status / payment_method values
+_STATUS_MAP: Dict[str, TransactionStatus] = {
+    **dict.fromkeys(("completed", "success", "successful", "done"), TransactionStatus.COMPLETED),
+    **dict.fromkeys(("failed", "failure", "rejected"), TransactionStatus.FAILED),
+    **dict.fromkeys(("pending", "processing", "in progress"), TransactionStatus.PENDING),
+}
+_PAYMENT_METHOD_MAP: Dict[str, PaymentMethod] = {
+    **dict.fromkeys(("UPI", "BHIM", "GPAY", "PHONEPE", "PAYTM"), PaymentMethod.UPI),
+    "NEFT": PaymentMethod.NEFT,
+    "IMPS": PaymentMethod.IMPS,
+}
+
+# Map error codes to valid review_reason values
+_ERROR_TO_REVIEW_REASON: Dict[str, str] = {
+    "ai_failed": "ai_uncertain",
+    "invalid_image": "validation_failed",
+    "payment_date_invalid": "date_mismatch",
+    "not_payment_screenshot": "not_payment_screenshot",
+    "validation_failed": "validation_failed",
+    "service_error": "service_error",
+    "service_disabled": "service_disabled",
+    "daily_limit_exceeded": "service_disabled",
+    "model_not_free": "service_disabled",
+}
+
+
+@dataclass
+class _ParseContext:
+    """Per-request values shared by the pre- and post-provider steps."""
+    start_time: int  # time.perf_counter_ns()
+    match_date: Optional[str] = None
+    provider_name: str = ""
+    model_id: str = ""
+    model_cost_tier: str = "unknown"
+    image_hash: str = ""
+    image_bytes: bytes = b""
+
 
 class PaymentParserService:
     """
@@ -42,7 +97,7 @@ class PaymentParserService:
     5. Response formatting
     """
     
-    def __init__(self, provider: AIProviderBase = None):
+    def __init__(self, provider: "AIProviderBase" = None):
         """
         Initialize the payment parser service.
         
@@ -50,14 +105,36 @@ class PaymentParserService:
             provider: Optional AI provider override
         """
         self._provider = provider
+        # Results of earlier parses, by (image hash, match date) - None when disabled
+        self._result_cache: Optional[TTLCache] = None
+        if PARSE_CACHE_ENABLED:
+            self._result_cache = TTLCache(maxsize=PARSE_CACHE_MAX_SIZE, ttl=PARSE_CACHE_TTL_SECONDS)
+        # Parses currently running, by cache key - concurrent duplicates await these
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        
+        # Coalesce concurrent provider calls into multi-image requests
+        self._batcher: Optional[AsyncBatcher] = None
+        if PARSE_BATCH_ENABLED:
+            self._batcher = AsyncBatcher(
+                self._parse_image_batch,
+                max_batch_size=PARSE_BATCH_MAX_SIZE,
+                max_queue_time=PARSE_BATCH_MAX_WAIT_MS / 1000,
+                concurrency=PARSE_BATCH_CONCURRENCY,
+            )
     
     @property
-    def provider(self) -> AIProviderBase:
-        """Get or create the AI provider."""
+    def provider(self) -> "AIProviderBase":
+        """Get or create the AI provider (imported here to keep module import light)."""
         if self._provider is None:
+            from providers import get_provider
             self._provider = get_provider()
         return self._provider
     
+    @cached_property
+    def _provider_name(self) -> str:
+        """Provider name - fixed once the provider is built."""
+        return self.provider.get_provider_name()
+    
     async def parse_payment_screenshot(
         self,
         image_base64: str,
@@ -73,244 +150,304 @@ class PaymentParserService:
         Returns:
             ParsePaymentResponse with extracted data or error
         """
-        start_time = time.time()
-        provider_name = ""
-        model_id = ""
+        ctx = _ParseContext(start_time=time.perf_counter_ns(), match_date=match_date)
         
         try:
-            # Get provider info early for error responses
-            provider_name = self.provider.get_provider_name()
-            model_id = self.provider.get_model_id()
-            
-            # Generate image hash for deduplication
-            image_hash, _ = generate_image_hash(image_base64)
-            
-            # Determine model cost tier
-            model_cost_tier = "free" if self.provider.is_free_tier() else "paid"
-            
-            # 1. Check master kill switch
-            if not AI_SERVICE_ENABLED:
-                return self._error_response(
-                    "service_disabled",
-                    "AI service is disabled",
-                    provider_name,
-                    model_id,
-                    model_cost_tier,
-                    image_hash,
-                    start_time
-                )
-            
-            # 2. Check cost guardrails
-            should_block, block_reason = should_block_request(model_id)
-            if should_block:
-                return self._error_response(
-                    block_reason,
-                    f"Request blocked: {block_reason}",
-                    provider_name,
-                    model_id,
-                    model_cost_tier,
-                    image_hash,
-                    start_time
-                )
-            
-            # 3. Validate image
-            is_valid, validation_error = ImageValidator.validate(image_base64)
-            if not is_valid:
-                return self._error_response(
-                    "invalid_image",
-                    validation_error,
-                    provider_name,
-                    model_id,
-                    model_cost_tier,
-                    image_hash,
-                    start_time
-                )
-            
-            # 4. Increment request counter
-            increment_request_count()
-            logger.info(f"Request #{get_request_count()}/{DAILY_REQUEST_LIMIT} - Processing image")
-            
-            # 5. Call AI provider
-            ai_result = await self.provider.parse_payment_image(image_base64, match_date)
-            
-            # 6. Check for AI errors
-            if "error" in ai_result and ai_result.get("error"):
-                return self._error_response(
-                    "ai_failed",
-                    f"AI processing failed: {ai_result['error']}",
-                    provider_name,
-                    model_id,
-                    model_cost_tier,
-                    image_hash,
-                    start_time
-                )
-            
-            # 7. Check if it's a payment screenshot
-            if not ai_result.get("is_payment_screenshot", False):
-                detected_type = ai_result.get("detected_type", "unknown")
-                return ParsePaymentResponse(
-                    success=False,
-                    error_code="not_payment_screenshot",
-                    error_message=f"Image is not a payment screenshot. Detected: {detected_type}",
-                    data=PaymentData(),
-                    metadata=ResponseMetadata(
-                        confidence=0.0,
-                        is_payment_screenshot=False,
-                        processing_time_ms=self._get_elapsed_ms(start_time),
-                        provider=provider_name,
-                        model=model_id,
-                        model_cost_tier=model_cost_tier,
-                        image_hash=image_hash,
-                        requires_review=True,
-                        review_reason="not_payment_screenshot"
-                    )
-                )
-            
-            # 8. Build payment data
-            payment_data = PaymentData(
-                amount=float(ai_result.get("amount", 0)),
-                currency=str(ai_result.get("currency", "INR")),
-                payer_name=str(ai_result.get("payer_name", "")),
-                payee_name=str(ai_result.get("payee_name", "")),
-                date=str(ai_result.get("date", "")),
-                time=str(ai_result.get("time", "")),
-                transaction_status=self._normalize_status(ai_result.get("transaction_status")),
-                transaction_id=str(ai_result.get("transaction_id", "")),
-                payment_method=self._normalize_payment_method(ai_result.get("payment_method")),
-                upi_id=str(ai_result.get("upi_id", ""))
-            )
-            
-            confidence = float(ai_result.get("confidence", 0.0))
-            requires_review = False
-            review_reason = None
-            
-            # 9. Validate amount
-            if payment_data.amount <= 0:
-                requires_review = True
-                review_reason = "validation_failed"
-                logger.warning("Amount is 0 or negative - flagging for review")
-            
-            # 10. Validate date against match date
-            if match_date and payment_data.date:
-                date_valid, date_reason = DateValidator.validate_payment_date(
-                    payment_data.date,
-                    match_date
-                )
-                if not date_valid:
-                    requires_review = True
-                    review_reason = date_reason
-                    logger.warning(f"Date validation failed: {date_reason}")
+            early_response = await self._identify(image_base64, ctx)
+        except Exception as e:
+            return self._unexpected_error_response(e, ctx)
+        if early_response:
+            return early_response
+        
+        # Dedup disabled - there is no image hash to match on
+        if self._result_cache is None:
+            return await self._parse(ctx)
+        
+        # Same image already being parsed (double submit) - share that result
+        key = self._cache_key(ctx)
+        while (inflight := self._inflight.get(key)) is not None:
+            logger.info(f"Joining in-flight parse for image {ctx.image_hash[:12]}")
+            try:
+                return self._with_elapsed(await asyncio.shield(inflight), ctx)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise  # This request itself was cancelled
+                # The leading request was cancelled (client gone) - parse this one ourselves
+                logger.info(f"In-flight parse for image {ctx.image_hash[:12]} was cancelled, retrying")
+        
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            response = await self._parse(ctx)
+            fut.set_result(response)
+            return response
+        finally:
+            del self._inflight[key]
+            if not fut.done():
+                fut.cancel()
+    
+    async def _parse(self, ctx: _ParseContext) -> ParsePaymentResponse:
+        """Run the checks and the provider call for an identified image."""
+        try:
+            early_response = await self._prepare(ctx)
+            if early_response:
+                return early_response
             
-            # 11. Check confidence threshold
-            if confidence < MIN_CONFIDENCE_THRESHOLD:
-                requires_review = True
-                if not review_reason:
-                    review_reason = "low_confidence"
-                logger.warning(f"Low confidence: {confidence}")
+            # 5. Call AI provider (batched with concurrent requests when enabled)
+            if self._batcher is not None:
+                ai_result = await self._batcher.process((ctx.image_bytes, ctx.match_date))
+            else:
+                ai_result = await self.provider.parse_payment_image(ctx.image_bytes, ctx.match_date)
             
-            # 12. Build response
-            processing_time_ms = self._get_elapsed_ms(start_time)
+            return self._complete(ai_result, ctx)
             
-            return ParsePaymentResponse(
-                success=True,
-                error_code=None,
-                error_message=None,
-                data=payment_data,
-                metadata=ResponseMetadata(
-                    confidence=confidence,
-                    is_payment_screenshot=True,
-                    processing_time_ms=processing_time_ms,
-                    provider=provider_name,
-                    model=model_id,
-                    model_cost_tier=model_cost_tier,
-                    image_hash=image_hash,
-                    requires_review=requires_review,
-                    review_reason=review_reason
-                )
+        except Exception as e:
+            return self._unexpected_error_response(e, ctx)
+    
+    async def close(self):
+        """Stop background work (the request batcher, if enabled)."""
+        if self._batcher is not None:
+            await self._batcher.close()
+    
+    async def _parse_image_batch(self, images: List[Tuple[bytes, Optional[str]]]) -> List[dict]:
+        """Batcher callback - one provider call for every queued image."""
+        return await self.provider.parse_payment_image_batch(images)
+    
+    async def _identify(self, image_base64: str, ctx: _ParseContext) -> Optional[ParsePaymentResponse]:
+        """
+        Fill in provider info and decode/hash the image.
+        
+        Runs first so every later response (errors included) carries
+        provider info and the image hash.
+        
+        Returns:
+            An error response if the payload is too large to decode,
+            None otherwise
+        """
+        # Get provider info early for error responses. The model is read every
+        # time - providers switch to a fallback model when the current one fails.
+        ctx.provider_name = self._provider_name
+        ctx.model_id = self.provider.get_model_id()
+        
+        # Determine model cost tier
+        ctx.model_cost_tier = "free" if self.provider.is_free_tier() else "paid"
+        
+        # Oversized payloads are turned away by length, before paying for the decode
+        is_valid, validation_error = ImageValidator.validate_encoded_size(image_base64)
+        if not is_valid:
+            return self._error_response("invalid_image", validation_error, ctx)
+        
+        # Decode once and hash for deduplication (CPU-bound - keep off the event loop).
+        # The decoded bytes are reused for validation and the provider call.
+        if self._result_cache is not None:
+            ctx.image_hash, ctx.image_bytes = await asyncio.to_thread(generate_image_hash, image_base64)
+        else:
+            ctx.image_bytes = await asyncio.to_thread(decode_image_base64, image_base64)
+        return None
+    
+    async def _prepare(self, ctx: _ParseContext) -> Optional[ParsePaymentResponse]:
+        """
+        Run every check that happens before the AI provider is called.
+        
+        Returns:
+            An error or cached response if the request must stop here,
+            None otherwise
+        """
+        # 1. Check master kill switch
+        if not AI_SERVICE_ENABLED:
+            return self._error_response("service_disabled", "AI service is disabled", ctx)
+        
+        # Duplicate upload / retry - reuse the earlier result (no quota used)
+        cached = self._result_cache.get(self._cache_key(ctx)) if self._result_cache is not None else None
+        if cached is not None:
+            logger.info(f"Cache hit for image {ctx.image_hash[:12]}")
+            return self._with_elapsed(cached, ctx)
+        
+        # 2 + 3. Cost guardrails (counter I/O) and image validation (CPU, in a
+        # thread) are independent - run them together, report in order
+        (should_block, block_reason), (is_valid, validation_error) = await asyncio.gather(
+            should_block_request(ctx.model_id),
+            asyncio.to_thread(ImageValidator.validate_bytes, ctx.image_bytes),
+        )
+        
+        # 2. Check cost guardrails
+        if should_block:
+            return self._error_response(block_reason, f"Request blocked: {block_reason}", ctx)
+        
+        # 3. Validate image
+        if not is_valid:
+            return self._error_response("invalid_image", validation_error, ctx)
+        
+        # Downscale oversized screenshots before upload (the hash stays on the original)
+        ctx.image_bytes = await asyncio.to_thread(ImageNormalizer.normalize, ctx.image_bytes)
+        
+        # 4. Increment request counter - the atomic increment is the authoritative
+        # daily-limit check (the guardrail check above may use a cached count)
+        request_count = await increment_request_count()
+        if request_count > DAILY_REQUEST_LIMIT:
+            # Not served - give the slot back so requests_today counts served requests only
+            await decrement_request_count()
+            return self._error_response(
+                "daily_limit_exceeded", "Request blocked: daily_limit_exceeded", ctx
             )
+        logger.info(f"Request #{request_count}/{DAILY_REQUEST_LIMIT} - Processing image")
+        
+        return None
+    
+    def _cache_key(self, ctx: _ParseContext) -> Tuple[str, str]:
+        """Result cache key - match_date is included since it affects date validation."""
+        return ctx.image_hash, ctx.match_date or ""
+    
+    def _with_elapsed(self, response: ParsePaymentResponse, ctx: _ParseContext) -> ParsePaymentResponse:
+        """
+        Copy of a shared (cached or in-flight) response timed for this request.
+        
+        Flagged as a cache hit - this request made no AI call of its own.
+        """
+        return response.model_copy(update={
+            "metadata": response.metadata.model_copy(update={
+                "processing_time_ms": self._get_elapsed_ms(ctx.start_time),
+                "cache_hit": True,
+            })
+        })
+    
+    def _complete(self, ai_result: dict, ctx: _ParseContext) -> ParsePaymentResponse:
+        """Build the response and cache it if it succeeded."""
+        response = self._build_response(ai_result, ctx)
+        # Cache definitive answers only (parsed, or not a payment at all) so
+        # transient failures can be retried
+        if self._result_cache is not None and (
+            response.success or response.error_code == ErrorCode.NOT_PAYMENT_SCREENSHOT
+        ):
+            self._result_cache[self._cache_key(ctx)] = response
+        return response
+    
+    def _build_response(self, ai_result: dict, ctx: _ParseContext) -> ParsePaymentResponse:
+        """
+        Turn the AI provider's result into a ParsePaymentResponse.
+        
+        Args:
+            ai_result: Dict returned by the provider
+            ctx: Context filled in by _prepare
             
-        except Exception as e:
-            logger.error(f"Unexpected error in payment parsing: {e}", exc_info=True)
+        Returns:
+            ParsePaymentResponse with extracted data or error
+        """
+        # 6. Check for AI errors
+        if "error" in ai_result and ai_result.get("error"):
             return self._error_response(
-                "service_error",
-                f"Unexpected error: {str(e)}",
-                provider_name,
-                model_id,
-                model_cost_tier,
-                image_hash,
-                start_time
+                "ai_failed",
+                f"AI processing failed: {ai_result['error']}",
+                ctx
             )
+        
+        # 7. Check if it's a payment screenshot
+        if not ai_result.get("is_payment_screenshot", False):
+            detected_type = ai_result.get("detected_type", "unknown")
+            return ParsePaymentResponse.error_response(
+                error_code="not_payment_screenshot",
+                error_message=f"Image is not a payment screenshot. Detected: {detected_type}",
+                review_reason="not_payment_screenshot",
+                provider=ctx.provider_name,
+                model=ctx.model_id,
+                model_cost_tier=ctx.model_cost_tier,
+                image_hash=ctx.image_hash,
+                processing_time_ms=self._get_elapsed_ms(ctx.start_time)
+            )
+        
+        # 8. Build payment data (every field is already coerced - skip validation)
+        payment_data = PaymentData.model_construct(
+            amount=float(ai_result.get("amount", 0)),
+            currency=str(ai_result.get("currency", "INR")),
+            payer_name=str(ai_result.get("payer_name", "")),
+            payee_name=str(ai_result.get("payee_name", "")),
+            date=str(ai_result.get("date", "")),
+            time=str(ai_result.get("time", "")),
+            transaction_status=self._normalize_status(ai_result.get("transaction_status")),
+            transaction_id=str(ai_result.get("transaction_id", "")),
+            payment_method=self._normalize_payment_method(ai_result.get("payment_method")),
+            upi_id=str(ai_result.get("upi_id", ""))
+        )
+        
+        # Clamp to 0-1: responses are built without validation below
+        confidence = min(max(float(ai_result.get("confidence", 0.0)), 0.0), 1.0)
+        requires_review = False
+        review_reason = None
+        
+        # 9. Validate amount
+        if payment_data.amount <= 0:
+            requires_review = True
+            review_reason = "validation_failed"
+            logger.warning("Amount is 0 or negative - flagging for review")
+        
+        # 10. Validate date against match date
+        if ctx.match_date and payment_data.date:
+            date_valid, date_reason = DateValidator.validate_payment_date(
+                payment_data.date,
+                ctx.match_date
+            )
+            if not date_valid:
+                requires_review = True
+                review_reason = date_reason
+                logger.warning(f"Date validation failed: {date_reason}")
+        
+        # 11. Check confidence threshold
+        if confidence < MIN_CONFIDENCE_THRESHOLD:
+            requires_review = True
+            if not review_reason:
+                review_reason = "low_confidence"
+            logger.warning(f"Low confidence: {confidence}")
+        
+        # 12. Build response
+        return ParsePaymentResponse.success_response(
+            data=payment_data,
+            confidence=confidence,
+            provider=ctx.provider_name,
+            model=ctx.model_id,
+            model_cost_tier=ctx.model_cost_tier,
+            image_hash=ctx.image_hash,
+            processing_time_ms=self._get_elapsed_ms(ctx.start_time),
+            requires_review=requires_review,
+            review_reason=review_reason
+        )
+    
+    def _unexpected_error_response(self, error: Exception, ctx: _ParseContext) -> ParsePaymentResponse:
+        """Log an unexpected exception and wrap it in a service_error response."""
+        logger.error(f"Unexpected error in payment parsing: {error}", exc_info=error)
+        return self._error_response("service_error", f"Unexpected error: {str(error)}", ctx)
     
     def _error_response(
         self,
         error_code: str,
         error_message: str,
-        provider: str,
-        model: str,
-        model_cost_tier: str,
-        image_hash: str,
-        start_time: float
+        ctx: _ParseContext
     ) -> ParsePaymentResponse:
         """Create an error response."""
-        # Map error codes to valid review_reason values
-        error_to_review_reason = {
-            "ai_failed": "ai_uncertain",
-            "invalid_image": "validation_failed",
-            "payment_date_invalid": "date_mismatch",
-            "not_payment_screenshot": "not_payment_screenshot",
-            "validation_failed": "validation_failed",
-            "service_error": "service_error",
-            "service_disabled": "service_disabled",
-            "daily_limit_exceeded": "service_disabled",
-            "model_not_free": "service_disabled",
-        }
+        review_reason = _ERROR_TO_REVIEW_REASON.get(error_code, "service_error")
         
-        review_reason = error_to_review_reason.get(error_code, "service_error")
-        
-        return ParsePaymentResponse(
-            success=False,
+        return ParsePaymentResponse.error_response(
             error_code=error_code,
             error_message=error_message,
-            data=PaymentData(),
-            metadata=ResponseMetadata(
-                confidence=0.0,
-                is_payment_screenshot=False,
-                processing_time_ms=self._get_elapsed_ms(start_time),
-                provider=provider,
-                model=model,
-                model_cost_tier=model_cost_tier,
-                image_hash=image_hash,
-                requires_review=True,
-                review_reason=review_reason
-            )
+            review_reason=review_reason,
+            provider=ctx.provider_name,
+            model=ctx.model_id,
+            model_cost_tier=ctx.model_cost_tier,
+            image_hash=ctx.image_hash,
+            processing_time_ms=self._get_elapsed_ms(ctx.start_time)
         )
     
-    def _get_elapsed_ms(self, start_time: float) -> int:
+    def _get_elapsed_ms(self, start_time: int) -> int:
         """Get elapsed time in milliseconds."""
-        return int((time.time() - start_time) * 1000)
+        return (time.perf_counter_ns() - start_time) // 1_000_000
     
-    def _normalize_status(self, status: str) -> str:
+    def _normalize_status(self, status: str) -> TransactionStatus:
         """Normalize transaction status to allowed values."""
         if not status:
-            return "unknown"
-        status_lower = status.lower().strip()
-        if status_lower in ("completed", "success", "successful", "done"):
-            return "completed"
-        elif status_lower in ("failed", "failure", "rejected"):
-            return "failed"
-        elif status_lower in ("pending", "processing", "in progress"):
-            return "pending"
-        return "unknown"
+            return TransactionStatus.UNKNOWN
+        return _STATUS_MAP.get(status.strip().lower(), TransactionStatus.UNKNOWN)
     
-    def _normalize_payment_method(self, method: str) -> str:
+    def _normalize_payment_method(self, method: str) -> PaymentMethod:
         """Normalize payment method to allowed values."""
         if not method:
-            return "unknown"
-        method_upper = method.upper().strip()
-        if method_upper in ("UPI", "BHIM", "GPAY", "PHONEPE", "PAYTM"):
-            return "UPI"
-        elif method_upper == "NEFT":
-            return "NEFT"
-        elif method_upper == "IMPS":
-            return "IMPS"
-        return "unknown"
+            return PaymentMethod.UNKNOWN
+        return _PAYMENT_METHOD_MAP.get(method.strip().upper(), PaymentMethod.UNKNOWN)
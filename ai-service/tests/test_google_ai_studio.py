@@ -0,0 +1,30 @@
+"""Tests for GoogleAIStudioProvider reply parsing."""
+
+import pytest
+
+from providers.google_ai_studio import GoogleAIStudioProvider
+
+REPLY = '{"is_payment_screenshot": true, "amount": 250}'
+
+
+@pytest.fixture
+def provider():
+    return GoogleAIStudioProvider()
+
+
+@pytest.mark.parametrize("text", [
+    REPLY,
+    f"```json\n{REPLY}\n```",
+    f"```\n{REPLY}\n```",
+    f"```json\n{REPLY}",        # Truncated - no closing fence
+    f"{REPLY}\n```",            # Closing fence only
+    f"  \n```json\n{REPLY}\n```\n  ",
+])
+def test_strip_code_fence(provider, text):
+    assert provider._strip_code_fence(text) == REPLY
+
+
+def test_parse_ai_response_with_closing_fence_only(provider):
+    result = provider._parse_ai_response(f"{REPLY}\n```")
+    assert result["is_payment_screenshot"] is True
+    assert result["amount"] == 250.0
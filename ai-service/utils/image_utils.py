@@ -4,31 +4,167 @@ Image Utilities
 Utility functions for image processing and hashing.
 """
 
+import binascii
 import hashlib
-import base64
-from typing import Tuple
+import struct
+import threading
+from typing import Optional, Tuple
 
+from cachetools import LRUCache
 
-def generate_image_hash(image_base64: str) -> Tuple[str, bytes]:
+# BLAKE3 is several times faster than hashlib; BLAKE2b is the stdlib fallback.
+# Digests are tagged with the algorithm so the two kinds are never confused.
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
+
+# SIMD-accelerated decoder when available; the stdlib one is a drop-in fallback
+try:
+    from pybase64 import b64decode
+except ImportError:
+    from base64 import b64decode
+
+
+# Recently hashed payloads: payload digest -> (hash_hex, image_bytes).
+# Only the decoded bytes are kept, and the bound is small because every
+# worker holds its own copy (pods have a 256Mi limit). Payloads bigger than
+# the bound are never cached. generate_image_hash runs in worker threads,
+# hence the lock.
+_RECENT_HASHES_MAX_BYTES = 4 * 1024 * 1024
+_recent_hashes: LRUCache = LRUCache(
+    maxsize=_RECENT_HASHES_MAX_BYTES,
+    getsizeof=lambda entry: len(entry[1]),
+)
+_recent_hashes_lock = threading.Lock()
+
+# Base64 characters decoded per step when hashing without keeping the bytes
+# (a multiple of 4, so every chunk decodes on its own - about 64KB of output)
+_B64_HASH_CHUNK_CHARS = 87_384
+
+
+def _strip_data_url(image_base64: str) -> str:
+    """Drop an optional data URL header ("data:<mime>;base64,")."""
+    # Base64 never contains a comma, so anything up to the first one is a header
+    # (with or without the "data:" scheme). Only the first 256 characters are
+    # searched - headers are short, and the (large) payload is never scanned.
+    idx = image_base64.find(",", 0, 256)
+    if idx != -1:
+        return image_base64[idx + 1:]
+    return image_base64
+
+
+def decode_image_base64(image_base64: str) -> bytes:
+    """
+    Decode a base64 image, accepting an optional data URL prefix.
+    
+    Args:
+        image_base64: Base64 encoded image data
+        
+    Returns:
+        Raw image bytes
+    """
+    return b64decode(_strip_data_url(image_base64), validate=False)
+
+
+def _new_hasher():
+    """Create the dedup hasher and its tag (see hash_image_bytes)."""
+    if blake3 is not None:
+        return "b3:", blake3()
+    return "b2:", hashlib.blake2b(digest_size=16)
+
+
+def _hexdigest(hasher) -> str:
+    """128-bit hex digest from a hasher made by _new_hasher."""
+    if blake3 is not None:
+        return hasher.hexdigest(length=16)
+    return hasher.hexdigest()
+
+
+def hash_image_bytes(image_bytes: bytes) -> str:
+    """
+    Generate a 128-bit hash of raw image bytes.
+    
+    Args:
+        image_bytes: Raw image data
+        
+    Returns:
+        Algorithm-tagged hex digest, "b3:<hex>" (BLAKE3) or "b2:<hex>"
+        (BLAKE2b) - a dedup key only, not used as a signature
+    """
+    tag, hasher = _new_hasher()
+    hasher.update(image_bytes)
+    return tag + _hexdigest(hasher)
+
+
+def _hash_image_base64_chunked(image_base64: str) -> str:
+    """
+    Hash a base64 image without materializing the decoded bytes.
+    
+    Decodes and hashes about 64KB at a time. Payloads that don't decode
+    chunk by chunk (embedded whitespace, odd padding) fall back to a full
+    decode, so the digest always matches hash_image_bytes.
+    
+    Args:
+        image_base64: Base64 encoded image data
+        
+    Returns:
+        Same digest as hash_image_bytes(decode_image_base64(image_base64))
     """
-    Generate SHA-256 hash of image for deduplication.
+    payload = _strip_data_url(image_base64)
+    tag, hasher = _new_hasher()
+    try:
+        for i in range(0, len(payload), _B64_HASH_CHUNK_CHARS):
+            hasher.update(b64decode(payload[i:i + _B64_HASH_CHUNK_CHARS], validate=True))
+    except (binascii.Error, ValueError):
+        return hash_image_bytes(decode_image_base64(image_base64))
+    return tag + _hexdigest(hasher)
+
+
+def generate_image_hash(
+    image_base64: str,
+    *,
+    return_bytes: bool = True
+) -> Tuple[str, Optional[bytes]]:
+    """
+    Decode an image and hash it for deduplication.
+    
+    This is the one place a request's base64 payload is decoded; callers
+    pass the returned bytes on instead of decoding again. Callers that only
+    need the hash pass return_bytes=False, which hashes in small chunks
+    instead of holding the whole decoded image in memory.
     
     Args:
         image_base64: Base64 encoded image data
+        return_bytes: Whether to return the decoded image bytes
         
     Returns:
-        Tuple of (hash_hex, image_bytes)
+        Tuple of (hash_hex, image_bytes), image_bytes is None when
+        return_bytes is False
     """
-    # Handle data URL format
-    if "," in image_base64:
-        image_base64 = image_base64.split(",")[1]
+    # Retried / re-entered payloads. The key is a cheap digest of the whole
+    # string (str hashes are per-process SipHash, cached on the object) plus
+    # its length and ends, so the payload itself never has to be kept.
+    cacheable = len(image_base64) * 3 // 4 <= _RECENT_HASHES_MAX_BYTES
+    if cacheable:
+        digest = (len(image_base64), hash(image_base64), image_base64[:64], image_base64[-64:])
+        with _recent_hashes_lock:
+            cached = _recent_hashes.get(digest)
+        if cached is not None:
+            return cached[0], cached[1] if return_bytes else None
     
-    # Decode base64
-    image_bytes = base64.b64decode(image_base64)
+    if not return_bytes:
+        return _hash_image_base64_chunked(image_base64), None
     
-    # Generate SHA-256 hash
-    hash_obj = hashlib.sha256(image_bytes)
-    hash_hex = hash_obj.hexdigest()
+    image_bytes = decode_image_base64(image_base64)
+    hash_hex = hash_image_bytes(image_bytes)
+    
+    if cacheable:
+        with _recent_hashes_lock:
+            try:
+                _recent_hashes[digest] = (hash_hex, image_bytes)
+            except ValueError:
+                pass  # Larger than the whole cache - don't keep it
     
     return hash_hex, image_bytes
 
@@ -39,10 +175,96 @@ def validate_image_consistency(image_base64: str, expected_hash: str) -> bool:
     
     Args:
         image_base64: Base64 encoded image data
-        expected_hash: Expected SHA-256 hash
+        expected_hash: Expected hash (as returned by generate_image_hash)
         
     Returns:
         True if hashes match, False otherwise
     """
-    actual_hash, _ = generate_image_hash(image_base64)
+    actual_hash, _ = generate_image_hash(image_base64, return_bytes=False)
     return actual_hash.lower() == expected_hash.lower()
+
+
+def validate_hash_bytes(image_bytes: bytes, expected_hash: str) -> bool:
+    """
+    Validate that already-decoded image bytes match an expected hash.
+    
+    Same check as validate_image_consistency, without decoding base64 again.
+    
+    Args:
+        image_bytes: Raw image data
+        expected_hash: Expected hash (as returned by generate_image_hash)
+        
+    Returns:
+        True if hashes match, False otherwise
+    """
+    return hash_image_bytes(image_bytes) == expected_hash.lower()
+
+
+# JPEG start-of-frame markers (SOF0-SOF15, excluding DHT/JPG/DAC)
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def parse_image_header(image_bytes: bytes) -> Optional[Tuple[str, int, int]]:
+    """
+    Read format and dimensions from the image header without decoding pixels.
+    
+    Handles PNG (IHDR), JPEG (SOFn marker), GIF (logical screen) and
+    WEBP (VP8 / VP8L / VP8X chunk). Format names match PIL's.
+    
+    Args:
+        image_bytes: Raw image data
+        
+    Returns:
+        Tuple of (format, width, height), or None if the header isn't recognised
+    """
+    try:
+        # PNG - IHDR is always the first chunk
+        if image_bytes[:8] == b"\x89PNG\r\n\x1a\n" and image_bytes[12:16] == b"IHDR":
+            width, height = struct.unpack(">II", image_bytes[16:24])
+            return "PNG", width, height
+        
+        # GIF - logical screen descriptor
+        if image_bytes[:6] in (b"GIF87a", b"GIF89a"):
+            width, height = struct.unpack("<HH", image_bytes[6:10])
+            return "GIF", width, height
+        
+        # WEBP - RIFF container, first chunk describes the bitstream
+        if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+            chunk = image_bytes[12:16]
+            if chunk == b"VP8 " and image_bytes[23:26] == b"\x9d\x01\x2a":
+                width, height = struct.unpack("<HH", image_bytes[26:30])
+                return "WEBP", width & 0x3FFF, height & 0x3FFF
+            if chunk == b"VP8L" and image_bytes[20] == 0x2F:
+                bits = int.from_bytes(image_bytes[21:25], "little")
+                return "WEBP", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8X":
+                width = int.from_bytes(image_bytes[24:27], "little") + 1
+                height = int.from_bytes(image_bytes[27:30], "little") + 1
+                return "WEBP", width, height
+            return None
+        
+        # JPEG - walk the marker segments up to the first SOFn
+        if image_bytes[:2] == b"\xff\xd8":
+            i = 2
+            while i + 9 <= len(image_bytes):
+                if image_bytes[i] != 0xFF:
+                    return None
+                marker = image_bytes[i + 1]
+                if marker == 0xFF:
+                    # Fill byte
+                    i += 1
+                    continue
+                if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                    # Standalone markers - no length field
+                    i += 2
+                    continue
+                if marker in _JPEG_SOF_MARKERS:
+                    height, width = struct.unpack(">HH", image_bytes[i + 5:i + 9])
+                    return "JPEG", width, height
+                (segment_length,) = struct.unpack(">H", image_bytes[i + 2:i + 4])
+                i += 2 + segment_length
+            return None
+    except (struct.error, IndexError):
+        return None
+    
+    return None
@@ -0,0 +1,18 @@
+"""
+Time Utilities
+
+Helpers for timestamps returned by the API.
+"""
+
+from datetime import datetime, timezone
+from time import time
+
+
+def iso_now() -> str:
+    """
+    Get the current UTC time as an ISO 8601 string (second precision).
+    
+    Returns:
+        str: e.g. "2024-01-15T10:30:00+00:00"
+    """
+    return datetime.fromtimestamp(time(), tz=timezone.utc).isoformat(timespec="seconds")